@@ -1,38 +1,177 @@
-from fastapi import FastAPI, APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Header, Query, Request
 from fastapi.websockets import WebSocketState
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Tuple, Deque
 import uuid
-from datetime import datetime, timezone
+import hashlib
+from datetime import datetime, timezone, timedelta
 import json
 import asyncio
 import random
+import time
+import bisect
+import gzip
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, suppress
+
+# NumPy is only needed by the anomaly detector; it is imported on first use (or during
+# warm-up) so it stays off the import path of every worker start.
+np = None
+
+def load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# The client is created by the lifespan handler rather than at import time
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+def connect_db():
+    global client, db
+    client = AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+        minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+        maxIdleTimeMS=int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000')),
+        waitQueueTimeoutMS=int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000')),
+        serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    )
+    db = client[os.environ['DB_NAME']]
+
+# Server-side time limit applied to reads via maxTimeMS
+DB_MAX_TIME_MS = int(os.environ.get('DB_MAX_TIME_MS', '5000'))
+
+# Database concurrency limits
+class DBLimiter:
+    """Bounds concurrent operations per collection and sheds load once too many are queued."""
+
+    def __init__(self, concurrency: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.waiting = 0
+        self.shed = 0
+
+    def overloaded(self, detail: str) -> HTTPException:
+        self.shed += 1
+        return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+    @asynccontextmanager
+    async def slot(self, collection: str):
+        if self.waiting >= self.max_queue:
+            raise self.overloaded("Database queue is full, retry later")
+        semaphore = self.semaphores.get(collection)
+        if semaphore is None:
+            semaphore = self.semaphores[collection] = asyncio.Semaphore(self.concurrency)
+        if semaphore.locked():
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self.overloaded(f"Timed out waiting for {collection}, retry later")
+            finally:
+                self.waiting -= 1
+        else:
+            # Uncontended: take the permit without the task wait_for would create
+            await semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+db_limiter = DBLimiter(
+    concurrency=int(os.environ.get('DB_COLLECTION_CONCURRENCY', '32')),
+    max_queue=int(os.environ.get('DB_MAX_QUEUE', '256')),
+    queue_timeout=float(os.environ.get('DB_QUEUE_TIMEOUT_MS', '2000')) / 1000,
+    retry_after=int(os.environ.get('DB_RETRY_AFTER_SECONDS', '1'))
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect_db()
+    # Warm-up runs in the background; /api/ready reports when it has finished
+    warmup_task = asyncio.create_task(warm_up())
+    retention_task = asyncio.create_task(retention_engine.run_forever()) if RETENTION_ENABLED else None
+    yield
+    # Let cancelled tasks unwind before the client they use goes away
+    for task in (warmup_task, retention_task):
+        if task:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    client.close()
 
 # Create the main app without a prefix
-app = FastAPI(title="Kubernetes Edge Computing Framework", version="1.0.0")
+app = FastAPI(title="Kubernetes Edge Computing Framework", version="1.0.0", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Push event settings shared by WebSocket, SSE and long-poll clients
+EVENT_BUFFER_SIZE = int(os.environ.get('EVENT_BUFFER_SIZE', '1000'))
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get('SUBSCRIBER_QUEUE_SIZE', '1000'))
+SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', '15'))
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', '3000'))
+LONG_POLL_MAX_SECONDS = float(os.environ.get('LONG_POLL_MAX_SECONDS', '30'))
+
 # WebSocket connection manager
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
         self.active_connections: List[WebSocket] = []
+        # Recent broadcasts by event id, replayed to SSE / long-poll clients that reconnect
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=buffer_size)
+        self.last_event_id = 0
+        # Client-facing ids are "<epoch>-<sequence>". The sequence restarts with the process and
+        # differs between workers, so the epoch tells ids from another sequence apart.
+        self.epoch = f"{int(time.time() * 1000)}.{os.getpid()}"
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def format_id(self, sequence: int) -> str:
+        return f"{self.epoch}-{sequence}"
+
+    def sequence_of(self, event_id: str) -> Optional[int]:
+        """Sequence number of an id issued by this process, or None for any other id"""
+        epoch, _, sequence = event_id.rpartition("-")
+        if epoch != self.epoch or not sequence.isdigit() or int(sequence) > self.last_event_id:
+            return None
+        return int(sequence)
+
+    def events_after(self, event_id: str) -> Optional[List[Tuple[int, str]]]:
+        """Buffered events newer than event_id, or None if the client can no longer catch up from the buffer"""
+        sequence = self.sequence_of(event_id)
+        if sequence is None:
+            # Issued by a previous instance or another worker
+            return None
+        if self.events and sequence + 1 < self.events[0][0]:
+            return None
+        return [event for event in self.events if event[0] > sequence]
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -47,6 +186,19 @@ class ConnectionManager:
             await websocket.send_text(message)
 
     async def broadcast(self, message: str):
+        self.last_event_id += 1
+        event = (self.last_event_id, message)
+        self.events.append(event)
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Drop the slow consumer; it resumes from the buffer when it reconnects
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+        
         disconnected = []
         for connection in self.active_connections:
             try:
@@ -125,7 +277,7 @@ class PerformanceMetric(BaseModel):
     cpu_usage: float
     memory_usage: float
     network_latency: float
-    deployment_latency: float
+    deployment_latency: Optional[float] = None  # seconds pending -> running, filled from lifecycle timing when omitted
     success_rate: float
 
 class SecurityEvent(BaseModel):
@@ -137,6 +289,16 @@ class SecurityEvent(BaseModel):
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     resolved: bool = False
 
+class AnomalyEvent(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    node_id: str
+    metric: str  # cpu_usage, memory_usage, network_latency
+    value: float
+    expected: float
+    z_score: float
+    severity: str  # medium, high, critical
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
 # Analytics Models
 class SystemAnalytics(BaseModel):
     total_nodes: int
@@ -149,6 +311,30 @@ class SystemAnalytics(BaseModel):
     success_rate: float
     security_incidents: int
 
+class MetricSummary(BaseModel):
+    average: float
+    p50: float
+    p95: float
+    p99: float
+
+class GroupedMetrics(BaseModel):
+    location: Optional[str] = None
+    node_type: Optional[str] = None
+    window_start: datetime
+    window_end: datetime
+    sample_count: int
+    cpu_usage: MetricSummary
+    memory_usage: MetricSummary
+    network_latency: MetricSummary
+
+class WorkloadTimingStats(BaseModel):
+    dimension: str  # workload_type, node_id, priority
+    value: str
+    phase: str  # queue_wait, execution_completed, execution_failed
+    count: int
+    max_seconds: float
+    seconds: MetricSummary
+
 # Helper functions
 def prepare_for_mongo(data):
     if isinstance(data, dict):
@@ -168,27 +354,492 @@ def parse_from_mongo(item):
                         pass
     return item
 
+# Idempotent writes
+# Retries carrying the same Idempotency-Key map to the same deterministic record id, so the
+# unique index on `id` rejects the duplicate insert; a short-lived cache answers most retries
+# without touching the database at all. Follow-up side effects (counters, buckets, anomaly
+# scoring) are tracked by flags on the stored record, so a retry redoes exactly the steps an
+# earlier attempt did not finish.
+IDEMPOTENT_COLLECTIONS = ("edge_nodes", "workloads", "performance_metrics", "security_events")
+
+class IdempotencyCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def get(self, scope: str, key: str) -> Any:
+        entry = self.entries.get((scope, key))
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            del self.entries[(scope, key)]
+            return None
+        return response
+
+    def put(self, scope: str, key: str, response: Any):
+        self.entries[(scope, key)] = (time.monotonic() + self.ttl, response)
+        self.entries.move_to_end((scope, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+idempotency_cache = IdempotencyCache(
+    ttl=float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '600')),
+    max_entries=int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+)
+
+def idempotent_id(scope: str, key: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"idempotency:{scope}:{key}"))
+
+def request_fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def idempotency_conflict() -> HTTPException:
+    return HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+
+def cached_response(scope: str, key: str, fingerprint: str) -> Any:
+    entry = idempotency_cache.get(scope, key)
+    if entry is None:
+        return None
+    stored_fingerprint, response = entry
+    if stored_fingerprint != fingerprint:
+        raise idempotency_conflict()
+    return response
+
+def check_fingerprint(existing: Dict[str, Any], fingerprint: Optional[str]):
+    if fingerprint and existing.get("request_hash") != fingerprint:
+        raise idempotency_conflict()
+
+async def insert_once(collection: str, document: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Insert a document, or return the stored copy if one with the same id already exists"""
+    try:
+        async with db_limiter.slot(collection):
+            await db[collection].insert_one(document)
+        return None
+    except DuplicateKeyError:
+        async with db_limiter.slot(collection):
+            existing = await db[collection].find_one({"id": document["id"]}, max_time_ms=DB_MAX_TIME_MS)
+        if existing:
+            check_fingerprint(existing, document.get("request_hash"))
+        return existing
+
+async def claim_side_effect(collection: str, record_id: str, flag: str) -> bool:
+    """Claim a side effect of a stored record; False if another attempt already ran or is running it"""
+    async with db_limiter.slot(collection):
+        claimed = await db[collection].find_one_and_update(
+            {"id": record_id, flag: {"$ne": True}},
+            {"$set": {flag: True}},
+            projection={"_id": 1}
+        )
+    return claimed is not None
+
+@asynccontextmanager
+async def side_effect(collection: str, flag: str, inserted_ids: List[str], retried_ids: List[str]):
+    """Yield the ids whose side effect this request holds: records it just inserted (stored with the
+    flag set) plus any retried records it manages to claim. Held claims are released if the block
+    fails, so the next retry runs the side effect again."""
+    held = list(inserted_ids)
+    try:
+        for record_id in retried_ids:
+            if await claim_side_effect(collection, record_id, flag):
+                held.append(record_id)
+        yield held
+    except Exception:
+        if held:
+            # Not gated by db_limiter: releasing the claims must not be shed
+            await db[collection].update_many({"id": {"$in": held}}, {"$set": {flag: False}})
+        raise
+
+# Anomaly detection
+ANOMALY_METRICS = ("cpu_usage", "memory_usage", "network_latency")
+
+class MetricAnomalyDetector:
+    """Streaming EWMA / z-score detector over per-node metric samples.
+
+    State lives in flat NumPy arrays indexed by a per-node slot, so memory is
+    O(1) per node and a whole tick of samples is scored in one vectorized pass.
+    """
+
+    def __init__(self, alpha: float = 0.1, threshold: float = 3.0, warmup: int = 10, capacity: int = 1024,
+                 min_std: float = 1.0, min_std_ratio: float = 0.02):
+        load_numpy()
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        # Floor on the standard deviation (absolute and relative to the mean) so flat or
+        # integer-valued gauges do not turn small jitter into huge z-scores
+        self.min_std = min_std
+        self.min_std_ratio = min_std_ratio
+        self.slots: Dict[str, int] = {}
+        self.free_slots: List[int] = []
+        self.mean = np.zeros((capacity, len(ANOMALY_METRICS)))
+        self.var = np.zeros((capacity, len(ANOMALY_METRICS)))
+        self.count = np.zeros(capacity, dtype=np.int64)
+
+    def _slot(self, node_id: str) -> int:
+        slot = self.slots.get(node_id)
+        if slot is not None:
+            return slot
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = len(self.slots)
+            if slot >= len(self.count):
+                self._grow()
+        self.slots[node_id] = slot
+        self.mean[slot] = 0.0
+        self.var[slot] = 0.0
+        self.count[slot] = 0
+        return slot
+
+    def _grow(self):
+        capacity = len(self.count) * 2
+        self.mean = np.resize(self.mean, (capacity, len(ANOMALY_METRICS)))
+        self.var = np.resize(self.var, (capacity, len(ANOMALY_METRICS)))
+        self.count = np.resize(self.count, capacity)
+
+    def forget(self, node_id: str):
+        slot = self.slots.pop(node_id, None)
+        if slot is not None:
+            self.free_slots.append(slot)
+
+    def observe(self, metric: PerformanceMetric) -> List[AnomalyEvent]:
+        return self.observe_batch([metric])
+
+    def observe_batch(self, metrics: List[PerformanceMetric]) -> List[AnomalyEvent]:
+        """Score and absorb one tick of samples; a node's latest sample in the tick wins."""
+        latest: Dict[str, PerformanceMetric] = {}
+        for metric in metrics:
+            latest[metric.node_id] = metric
+        if not latest:
+            return []
+
+        node_ids = list(latest.keys())
+        idx = np.fromiter((self._slot(node_id) for node_id in node_ids), dtype=np.int64, count=len(node_ids))
+        values = np.array([[getattr(latest[node_id], name) for name in ANOMALY_METRICS] for node_id in node_ids], dtype=float)
+
+        mean = self.mean[idx]
+        var = self.var[idx]
+        diff = values - mean
+        std = np.maximum(np.sqrt(var), np.maximum(self.min_std, self.min_std_ratio * np.abs(mean)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(std > 0, diff / std, 0.0)
+        warm = (self.count[idx] >= self.warmup)[:, None]
+        flagged = warm & (np.abs(z) >= self.threshold)
+
+        # The first sample seeds the baseline instead of being blended with zero
+        fresh = (self.count[idx] == 0)[:, None]
+        self.mean[idx] = np.where(fresh, values, mean + self.alpha * diff)
+        self.var[idx] = np.where(fresh, 0.0, (1 - self.alpha) * (var + self.alpha * diff * diff))
+        self.count[idx] += 1
+
+        events = []
+        for row, col in zip(*np.nonzero(flagged)):
+            score = float(z[row, col])
+            magnitude = abs(score)
+            if magnitude >= 2 * self.threshold:
+                severity = "critical"
+            elif magnitude >= 1.5 * self.threshold:
+                severity = "high"
+            else:
+                severity = "medium"
+            node_id = node_ids[row]
+            events.append(AnomalyEvent(
+                node_id=node_id,
+                metric=ANOMALY_METRICS[col],
+                value=float(values[row, col]),
+                expected=float(mean[row, col]),
+                z_score=score,
+                severity=severity,
+                timestamp=latest[node_id].timestamp
+            ))
+        return events
+
+anomaly_detector: Optional[MetricAnomalyDetector] = None
+
+def get_anomaly_detector() -> MetricAnomalyDetector:
+    global anomaly_detector
+    if anomaly_detector is None:
+        anomaly_detector = MetricAnomalyDetector()
+    return anomaly_detector
+
+async def record_anomalies(events: List[AnomalyEvent]):
+    if not events:
+        return
+    # expire_at stays a BSON date so the TTL index can act on it
+    expire_at = datetime.now(timezone.utc) + timedelta(days=TTL_RETENTION_DAYS["anomaly_events"])
+    async with db_limiter.slot("anomaly_events"):
+        await db.anomaly_events.insert_many([{**prepare_for_mongo(event.dict()), "expire_at": expire_at} for event in events])
+    for event in events:
+        await manager.broadcast(json.dumps({"type": "anomaly_detected", "data": prepare_for_mongo(event.dict()), "timestamp": datetime.now(timezone.utc).isoformat()}))
+
+# Pre-aggregated metric buckets
+# Each bucket document holds count, sums and a fixed-bin histogram per metric for one
+# (window_start, location, node_type), so grouped queries read buckets instead of raw samples.
+BUCKET_SECONDS = 300
+# Buckets expire after this many days, which also bounds the windows they can answer for
+METRIC_BUCKETS_RETENTION_DAYS = int(os.environ.get('METRIC_BUCKETS_RETENTION_DAYS', '30'))
+LIFECYCLE_SECONDS_EDGES = [0.0, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0, 7200.0, 21600.0, 86400.0]
+BUCKET_EDGES = {
+    "cpu_usage": [float(edge) for edge in range(0, 101, 5)],
+    "memory_usage": [float(edge) for edge in range(0, 101, 5)],
+    "network_latency": [0.0, 1.0, 2.0, 5.0, 10.0, 20.0, 35.0, 50.0, 75.0, 100.0, 150.0, 250.0, 500.0, 1000.0, 5000.0],
+    "queue_wait": LIFECYCLE_SECONDS_EDGES,
+    "execution_completed": LIFECYCLE_SECONDS_EDGES,
+    "execution_failed": LIFECYCLE_SECONDS_EDGES,
+}
+GROUP_FIELDS = ("location", "node_type")
+
+# node_id -> (expires_at, {location, node_type}). Entries expire so that workers which did not
+# handle a node update pick up its new location / node_type within NODE_GROUP_TTL_SECONDS.
+NODE_GROUP_TTL_SECONDS = float(os.environ.get('NODE_GROUP_TTL_SECONDS', '30'))
+UNKNOWN_GROUP = {field: "unknown" for field in GROUP_FIELDS}
+
+node_groups: Dict[str, Tuple[float, Dict[str, str]]] = {}
+
+def bucket_start(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % BUCKET_SECONDS, tz=timezone.utc)
+
+def histogram_bin(metric: str, value: float) -> int:
+    edges = BUCKET_EDGES[metric]
+    position = bisect.bisect_right(edges, value) - 1
+    return min(max(position, 0), len(edges) - 2)
+
+def histogram_percentile(metric: str, hist: Dict[str, int], quantile: float) -> float:
+    edges = BUCKET_EDGES[metric]
+    total = sum(hist.values())
+    if total == 0:
+        return 0.0
+    target = quantile * total
+    seen = 0
+    for position in range(len(edges) - 1):
+        count = hist.get(str(position), 0)
+        if count and seen + count >= target:
+            # Interpolate linearly inside the bin
+            fraction = (target - seen) / count
+            return edges[position] + fraction * (edges[position + 1] - edges[position])
+        seen += count
+    return edges[-1]
+
+def remember_node_group(node: Dict[str, Any]):
+    group = {field: node.get(field) or "unknown" for field in GROUP_FIELDS}
+    node_groups[node["id"]] = (time.monotonic() + NODE_GROUP_TTL_SECONDS, group)
+
+async def resolve_node_groups(node_ids: List[str]) -> Dict[str, Dict[str, str]]:
+    now = time.monotonic()
+    missing = [node_id for node_id in set(node_ids) if node_groups.get(node_id, (0.0, None))[0] <= now]
+    if missing:
+        async with db_limiter.slot("edge_nodes"):
+            nodes = await db.edge_nodes.find({"id": {"$in": missing}}, {"_id": 0, "id": 1, "location": 1, "node_type": 1}).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+        for node in nodes:
+            remember_node_group(node)
+        # Cache misses too, so metrics for unregistered nodes do not query edge_nodes every time
+        found = {node["id"] for node in nodes}
+        for node_id in missing:
+            if node_id not in found:
+                node_groups[node_id] = (now + NODE_GROUP_TTL_SECONDS, UNKNOWN_GROUP)
+    return {node_id: node_groups[node_id][1] for node_id in node_ids}
+
+async def update_metric_buckets(metrics: List[PerformanceMetric]):
+    """Fold metrics into their window buckets with one bulk upsert per call"""
+    if not metrics:
+        return
+    groups = await resolve_node_groups([metric.node_id for metric in metrics])
+    increments: Dict[tuple, Dict[str, int]] = {}
+    # Observed extremes bound the percentiles interpolated inside the wide histogram bins
+    lows: Dict[tuple, Dict[str, float]] = {}
+    highs: Dict[tuple, Dict[str, float]] = {}
+    for metric in metrics:
+        group = groups[metric.node_id]
+        key = (bucket_start(metric.timestamp), group["location"], group["node_type"])
+        inc = increments.setdefault(key, {"count": 0})
+        low = lows.setdefault(key, {})
+        high = highs.setdefault(key, {})
+        inc["count"] += 1
+        for name in ANOMALY_METRICS:
+            value = getattr(metric, name)
+            inc[f"{name}.sum"] = inc.get(f"{name}.sum", 0) + value
+            hist_key = f"{name}.hist.{histogram_bin(name, value)}"
+            inc[hist_key] = inc.get(hist_key, 0) + 1
+            low[f"{name}.min"] = min(low.get(f"{name}.min", value), value)
+            high[f"{name}.max"] = max(high.get(f"{name}.max", value), value)
+
+    operations = [
+        UpdateOne(
+            {"window_start": window_start.isoformat(), "location": location, "node_type": node_type},
+            {
+                "$inc": inc,
+                "$min": lows[(window_start, location, node_type)],
+                "$max": highs[(window_start, location, node_type)],
+                "$setOnInsert": {"expire_at": window_start + timedelta(days=TTL_RETENTION_DAYS["metric_buckets"])}
+            },
+            upsert=True
+        )
+        for (window_start, location, node_type), inc in increments.items()
+    ]
+    async with db_limiter.slot("metric_buckets"):
+        await db.metric_buckets.bulk_write(operations, ordered=False)
+
+def merge_buckets(buckets: List[Dict[str, Any]], fields: List[str]) -> Dict[tuple, Dict[str, Any]]:
+    """Combine window buckets into one count / sum / min / max / histogram per group key"""
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for bucket in buckets:
+        key = tuple(bucket.get(field) for field in fields)
+        group = groups.setdefault(key, {"count": 0, **{name: {"sum": 0.0, "min": None, "max": None, "hist": {}} for name in ANOMALY_METRICS}})
+        group["count"] += bucket.get("count", 0)
+        for name in ANOMALY_METRICS:
+            stats = bucket.get(name, {})
+            merged = group[name]
+            merged["sum"] += stats.get("sum", 0.0)
+            if stats.get("min") is not None:
+                merged["min"] = stats["min"] if merged["min"] is None else min(merged["min"], stats["min"])
+            if stats.get("max") is not None:
+                merged["max"] = stats["max"] if merged["max"] is None else max(merged["max"], stats["max"])
+            for position, count in stats.get("hist", {}).items():
+                merged["hist"][position] = merged["hist"].get(position, 0) + count
+    return groups
+
+def summarize_metric(metric: str, total: float, count: int, hist: Dict[str, int],
+                     maximum: Optional[float] = None, minimum: Optional[float] = None) -> MetricSummary:
+    def percentile(quantile: float) -> float:
+        value = histogram_percentile(metric, hist, quantile)
+        if maximum is not None:
+            value = min(value, maximum)
+        if minimum is not None:
+            value = max(value, minimum)
+        return value
+    return MetricSummary(
+        average=total / count if count else 0.0,
+        p50=percentile(0.50),
+        p95=percentile(0.95),
+        p99=percentile(0.99)
+    )
+
+# Workload lifecycle timing
+# Phase durations are derived on each status transition and folded into one histogram
+# document per (dimension, value, phase), so percentile queries never rescan workloads.
+# Execution is split by terminal status so failures do not skew completed-run percentiles.
+LIFECYCLE_DIMENSIONS = ("workload_type", "node_id", "priority")
+LIFECYCLE_PHASES = ("queue_wait", "execution_completed", "execution_failed")
+
+# node_id -> (expires_at, (recorded_at, seconds) or None), the node's latest queue wait. Cached
+# like node_groups so metric ingest does not query workload_timing on every sample; a wait older
+# than QUEUE_WAIT_MAX_AGE_SECONDS no longer describes the node and is not stamped on new samples.
+QUEUE_WAIT_TTL_SECONDS = float(os.environ.get('QUEUE_WAIT_TTL_SECONDS', '30'))
+QUEUE_WAIT_MAX_AGE_SECONDS = float(os.environ.get('QUEUE_WAIT_MAX_AGE_SECONDS', '3600'))
+
+queue_waits: Dict[str, Tuple[float, Optional[Tuple[datetime, float]]]] = {}
+
+def remember_queue_wait(node_id: str, latest: Optional[Tuple[datetime, float]]):
+    queue_waits[node_id] = (time.monotonic() + QUEUE_WAIT_TTL_SECONDS, latest)
+
+async def record_lifecycle_transition(previous: Dict[str, Any], status: str, now: datetime, execution_time: Optional[float]):
+    if previous.get("status") == status:
+        return
+    previous = parse_from_mongo(dict(previous))
+    durations = {}
+    # Only the first start waits in the queue; a failed -> running re-run is not a queue wait
+    if status == "running" and previous.get("status") == "pending" and isinstance(previous.get("created_at"), datetime):
+        durations["queue_wait"] = (now - previous["created_at"]).total_seconds()
+    elif status in ["completed", "failed"]:
+        if isinstance(previous.get("deployed_at"), datetime):
+            durations[f"execution_{status}"] = (now - previous["deployed_at"]).total_seconds()
+        elif execution_time:
+            durations[f"execution_{status}"] = execution_time
+    if not durations:
+        return
+
+    operations = []
+    for phase, seconds in durations.items():
+        seconds = max(seconds, 0.0)
+        for dimension in LIFECYCLE_DIMENSIONS:
+            operations.append(UpdateOne(
+                {"dimension": dimension, "value": previous.get(dimension) or "unknown", "phase": phase},
+                {
+                    "$inc": {"count": 1, "sum": seconds, f"hist.{histogram_bin(phase, seconds)}": 1},
+                    "$max": {"max": seconds},
+                    "$set": {"last": seconds, "last_at": now.isoformat()}
+                },
+                upsert=True
+            ))
+    # Not gated by db_limiter: the status change is already committed, and a retry would see an
+    # unchanged status and skip this sample, so shedding here would lose it for good
+    await db.workload_timing.bulk_write(operations, ordered=False)
+    if "queue_wait" in durations and previous.get("node_id"):
+        remember_queue_wait(previous["node_id"], (now, max(durations["queue_wait"], 0.0)))
+
+async def fill_deployment_latency(metrics: List[PerformanceMetric]) -> List[PerformanceMetric]:
+    """Fill omitted deployment latencies from each node's recent queue wait; unknown stays None"""
+    node_ids = {metric.node_id for metric in metrics if metric.deployment_latency is None}
+    if not node_ids:
+        return metrics
+    now = time.monotonic()
+    missing = [node_id for node_id in node_ids if node_id not in queue_waits or queue_waits[node_id][0] < now]
+    if missing:
+        async with db_limiter.slot("workload_timing"):
+            timings = await db.workload_timing.find(
+                {"dimension": "node_id", "phase": "queue_wait", "value": {"$in": missing}},
+                {"_id": 0, "value": 1, "last": 1, "last_at": 1}
+            ).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+        found = {
+            timing["value"]: (datetime.fromisoformat(timing["last_at"]), timing["last"])
+            for timing in timings if timing.get("last_at") and timing.get("last") is not None
+        }
+        # Misses are cached too, so nodes without workloads do not query workload_timing every time
+        for node_id in missing:
+            remember_queue_wait(node_id, found.get(node_id))
+
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=QUEUE_WAIT_MAX_AGE_SECONDS)
+    latest = {}
+    for node_id in node_ids:
+        entry = queue_waits[node_id][1]
+        latest[node_id] = entry[1] if entry and entry[0] >= cutoff else None
+    return [
+        metric if metric.deployment_latency is not None else metric.copy(update={"deployment_latency": latest[metric.node_id]})
+        for metric in metrics
+    ]
+
 # Edge Node Routes
 @api_router.post("/edge-nodes", response_model=EdgeNode)
-async def create_edge_node(node: EdgeNodeCreate):
+async def create_edge_node(node: EdgeNodeCreate, idempotency_key: Optional[str] = Header(None)):
+    fingerprint = request_fingerprint(node.dict(exclude_unset=True)) if idempotency_key else None
+    if idempotency_key:
+        cached = cached_response("edge_nodes", idempotency_key, fingerprint)
+        if cached is not None:
+            return cached
+    
     node_dict = node.dict()
+    if idempotency_key:
+        node_dict["id"] = idempotent_id("edge_nodes", idempotency_key)
     edge_node = EdgeNode(**node_dict)
-    node_data = prepare_for_mongo(edge_node.dict())
-    await db.edge_nodes.insert_one(node_data)
-    
-    # Broadcast update
-    await manager.broadcast(json.dumps({"type": "node_created", "data": prepare_for_mongo(edge_node.dict()), "timestamp": datetime.now(timezone.utc).isoformat()}))
+    node_data = {**prepare_for_mongo(edge_node.dict()), "request_hash": fingerprint}
+    existing = await insert_once("edge_nodes", node_data)
+    if existing:
+        edge_node = EdgeNode(**parse_from_mongo(existing))
+    else:
+        remember_node_group(node_data)
+        
+        # Broadcast update
+        await manager.broadcast(json.dumps({"type": "node_created", "data": prepare_for_mongo(edge_node.dict()), "timestamp": datetime.now(timezone.utc).isoformat()}))
     
+    if idempotency_key:
+        idempotency_cache.put("edge_nodes", idempotency_key, (fingerprint, edge_node))
     return edge_node
 
 @api_router.get("/edge-nodes", response_model=List[EdgeNode])
 async def get_edge_nodes():
-    nodes = await db.edge_nodes.find().to_list(1000)
+    async with db_limiter.slot("edge_nodes"):
+        nodes = await db.edge_nodes.find().max_time_ms(DB_MAX_TIME_MS).to_list(1000)
     return [EdgeNode(**parse_from_mongo(node)) for node in nodes]
 
 @api_router.get("/edge-nodes/{node_id}", response_model=EdgeNode)
 async def get_edge_node(node_id: str):
-    node = await db.edge_nodes.find_one({"id": node_id})
+    async with db_limiter.slot("edge_nodes"):
+        node = await db.edge_nodes.find_one({"id": node_id}, max_time_ms=DB_MAX_TIME_MS)
     if not node:
         raise HTTPException(status_code=404, detail="Edge node not found")
     return EdgeNode(**parse_from_mongo(node))
@@ -198,15 +849,18 @@ async def update_edge_node(node_id: str, update: EdgeNodeUpdate):
     update_data = {k: v for k, v in update.dict().items() if v is not None}
     update_data['last_heartbeat'] = datetime.now(timezone.utc)
     
-    result = await db.edge_nodes.update_one(
-        {"id": node_id},
-        {"$set": prepare_for_mongo(update_data)}
-    )
+    async with db_limiter.slot("edge_nodes"):
+        result = await db.edge_nodes.update_one(
+            {"id": node_id},
+            {"$set": prepare_for_mongo(update_data)}
+        )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Edge node not found")
     
-    node = await db.edge_nodes.find_one({"id": node_id})
+    async with db_limiter.slot("edge_nodes"):
+        node = await db.edge_nodes.find_one({"id": node_id}, max_time_ms=DB_MAX_TIME_MS)
+    remember_node_group(node)
     updated_node = EdgeNode(**parse_from_mongo(node))
     
     # Broadcast update
@@ -216,9 +870,13 @@ async def update_edge_node(node_id: str, update: EdgeNodeUpdate):
 
 @api_router.delete("/edge-nodes/{node_id}")
 async def delete_edge_node(node_id: str):
-    result = await db.edge_nodes.delete_one({"id": node_id})
+    async with db_limiter.slot("edge_nodes"):
+        result = await db.edge_nodes.delete_one({"id": node_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Edge node not found")
+    if anomaly_detector is not None:
+        anomaly_detector.forget(node_id)
+    node_groups.pop(node_id, None)
     
     # Broadcast update
     await manager.broadcast(json.dumps({"type": "node_deleted", "node_id": node_id, "timestamp": datetime.now(timezone.utc).isoformat()}))
@@ -227,59 +885,85 @@ async def delete_edge_node(node_id: str):
 
 # Workload Routes
 @api_router.post("/workloads", response_model=Workload)
-async def create_workload(workload: WorkloadCreate):
+async def create_workload(workload: WorkloadCreate, idempotency_key: Optional[str] = Header(None)):
+    fingerprint = request_fingerprint(workload.dict(exclude_unset=True)) if idempotency_key else None
+    if idempotency_key:
+        cached = cached_response("workloads", idempotency_key, fingerprint)
+        if cached is not None:
+            return cached
+    
     # Check if node exists
-    node = await db.edge_nodes.find_one({"id": workload.node_id})
+    async with db_limiter.slot("edge_nodes"):
+        node = await db.edge_nodes.find_one({"id": workload.node_id}, max_time_ms=DB_MAX_TIME_MS)
     if not node:
         raise HTTPException(status_code=404, detail="Edge node not found")
     
     workload_dict = workload.dict()
+    if idempotency_key:
+        workload_dict["id"] = idempotent_id("workloads", idempotency_key)
     new_workload = Workload(**workload_dict)
-    workload_data = prepare_for_mongo(new_workload.dict())
-    await db.workloads.insert_one(workload_data)
+    # A fresh record is stored with its workload_counted claim held by this request
+    workload_data = {**prepare_for_mongo(new_workload.dict()), "request_hash": fingerprint, "workload_counted": True}
+    existing = await insert_once("workloads", workload_data)
+    inserted_ids, retried_ids = ([], [new_workload.id]) if existing else ([new_workload.id], [])
+    if existing:
+        new_workload = Workload(**parse_from_mongo(existing))
     
-    # Update node workload count
-    await db.edge_nodes.update_one(
-        {"id": workload.node_id},
-        {"$inc": {"workload_count": 1}}
-    )
+    # Count the workload exactly once, even if an earlier attempt stored it and then failed
+    async with side_effect("workloads", "workload_counted", inserted_ids, retried_ids) as counted:
+        if counted:
+            # Update node workload count
+            async with db_limiter.slot("edge_nodes"):
+                await db.edge_nodes.update_one(
+                    {"id": new_workload.node_id},
+                    {"$inc": {"workload_count": 1}}
+                )
     
-    # Broadcast update
-    await manager.broadcast(json.dumps({"type": "workload_created", "data": prepare_for_mongo(new_workload.dict()), "timestamp": datetime.now(timezone.utc).isoformat()}))
+    if counted:
+        # Broadcast update
+        await manager.broadcast(json.dumps({"type": "workload_created", "data": prepare_for_mongo(new_workload.dict()), "timestamp": datetime.now(timezone.utc).isoformat()}))
     
+    if idempotency_key:
+        idempotency_cache.put("workloads", idempotency_key, (fingerprint, new_workload))
     return new_workload
 
 @api_router.get("/workloads", response_model=List[Workload])
 async def get_workloads():
-    workloads = await db.workloads.find().to_list(1000)
+    async with db_limiter.slot("workloads"):
+        workloads = await db.workloads.find().max_time_ms(DB_MAX_TIME_MS).to_list(1000)
     return [Workload(**parse_from_mongo(workload)) for workload in workloads]
 
 @api_router.get("/workloads/node/{node_id}", response_model=List[Workload])
 async def get_node_workloads(node_id: str):
-    workloads = await db.workloads.find({"node_id": node_id}).to_list(1000)
+    async with db_limiter.slot("workloads"):
+        workloads = await db.workloads.find({"node_id": node_id}).max_time_ms(DB_MAX_TIME_MS).to_list(1000)
     return [Workload(**parse_from_mongo(workload)) for workload in workloads]
 
 @api_router.put("/workloads/{workload_id}/status")
 async def update_workload_status(workload_id: str, status: str, execution_time: Optional[float] = None):
+    now = datetime.now(timezone.utc)
     update_data = {"status": status}
     
     if status == "running":
-        update_data["deployed_at"] = datetime.now(timezone.utc)
+        update_data["deployed_at"] = now
     elif status in ["completed", "failed"]:
-        update_data["completed_at"] = datetime.now(timezone.utc)
+        update_data["completed_at"] = now
         if execution_time:
             update_data["execution_time"] = execution_time
     
-    result = await db.workloads.update_one(
-        {"id": workload_id},
-        {"$set": prepare_for_mongo(update_data)}
-    )
+    # The pre-update document tells us which transition this is
+    async with db_limiter.slot("workloads"):
+        previous = await db.workloads.find_one_and_update(
+            {"id": workload_id},
+            {"$set": prepare_for_mongo(update_data)},
+            return_document=ReturnDocument.BEFORE
+        )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Workload not found")
     
-    workload = await db.workloads.find_one({"id": workload_id})
-    updated_workload = Workload(**parse_from_mongo(workload))
+    await record_lifecycle_transition(previous, status, now, execution_time)
+    updated_workload = Workload(**parse_from_mongo({**previous, **update_data}))
     
     # Broadcast update
     await manager.broadcast(json.dumps({"type": "workload_updated", "data": prepare_for_mongo(updated_workload.dict()), "timestamp": datetime.now(timezone.utc).isoformat()}))
@@ -288,42 +972,146 @@ async def update_workload_status(workload_id: str, status: str, execution_time:
 
 # Performance Metrics Routes
 @api_router.post("/metrics", response_model=PerformanceMetric)
-async def create_performance_metric(metric: PerformanceMetric):
-    metric_data = prepare_for_mongo(metric.dict())
-    await db.performance_metrics.insert_one(metric_data)
+async def create_performance_metric(metric: PerformanceMetric, idempotency_key: Optional[str] = Header(None)):
+    fingerprint = request_fingerprint(metric.dict(exclude_unset=True)) if idempotency_key else None
+    if idempotency_key:
+        cached = cached_response("performance_metrics", idempotency_key, fingerprint)
+        if cached is not None:
+            return cached
+        metric = metric.copy(update={"id": idempotent_id("performance_metrics", idempotency_key)})
+    metric = (await fill_deployment_latency([metric]))[0]
+    
+    # A fresh record is stored with its side-effect claims held by this request
+    metric_data = {**prepare_for_mongo(metric.dict()), "request_hash": fingerprint, "bucketed": True, "anomaly_checked": True}
+    existing = await insert_once("performance_metrics", metric_data)
+    inserted_ids, retried_ids = ([], [metric.id]) if existing else ([metric.id], [])
+    if existing:
+        metric = PerformanceMetric(**parse_from_mongo(existing))
+    
+    async with side_effect("performance_metrics", "anomaly_checked", inserted_ids, retried_ids) as checked:
+        async with side_effect("performance_metrics", "bucketed", inserted_ids, retried_ids) as bucketed:
+            if bucketed:
+                await update_metric_buckets([metric])
+        if checked:
+            await record_anomalies(get_anomaly_detector().observe(metric))
+    
+    if idempotency_key:
+        idempotency_cache.put("performance_metrics", idempotency_key, (fingerprint, metric))
     return metric
 
+@api_router.post("/metrics/bulk", response_model=List[PerformanceMetric])
+async def create_performance_metrics_bulk(metrics: List[PerformanceMetric], idempotency_key: Optional[str] = Header(None)):
+    """Ingest one tick of metrics for many nodes in a single round trip"""
+    if not metrics:
+        return []
+    fingerprints = [request_fingerprint(metric.dict(exclude_unset=True)) if idempotency_key else None for metric in metrics]
+    if idempotency_key:
+        fingerprint = request_fingerprint(fingerprints)
+        cached = cached_response("performance_metrics_bulk", idempotency_key, fingerprint)
+        if cached is not None:
+            return cached
+        metrics = [
+            metric.copy(update={"id": idempotent_id("performance_metrics", f"{idempotency_key}:{position}")})
+            for position, metric in enumerate(metrics)
+        ]
+    metrics = await fill_deployment_latency(metrics)
+    
+    documents = [
+        {**prepare_for_mongo(metric.dict()), "request_hash": metric_fingerprint, "bucketed": True, "anomaly_checked": True}
+        for metric, metric_fingerprint in zip(metrics, fingerprints)
+    ]
+    duplicates: Set[int] = set()
+    try:
+        async with db_limiter.slot("performance_metrics"):
+            await db.performance_metrics.insert_many(documents, ordered=False)
+    except BulkWriteError as error:
+        # Samples already stored by an earlier attempt are handled below; anything else is a real failure
+        write_errors = error.details.get("writeErrors", [])
+        duplicates = {write_error["index"] for write_error in write_errors if write_error.get("code") == 11000}
+        if len(duplicates) < len(write_errors):
+            failed = {write_error["index"] for write_error in write_errors}
+            stored_ids = [metric.id for position, metric in enumerate(metrics) if position not in failed]
+            # Hand the samples that did get stored back to the next retry
+            await db.performance_metrics.update_many({"id": {"$in": stored_ids}}, {"$set": {"bucketed": False, "anomaly_checked": False}})
+            raise
+    
+    by_id = {metric.id: metric for position, metric in enumerate(metrics) if position not in duplicates}
+    inserted_ids = list(by_id)
+    retried_ids = [metrics[position].id for position in sorted(duplicates)]
+    if retried_ids:
+        async with db_limiter.slot("performance_metrics"):
+            stored = await db.performance_metrics.find({"id": {"$in": retried_ids}}).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+        stored_by_id = {doc["id"]: doc for doc in stored}
+        for position in sorted(duplicates):
+            if metrics[position].id in stored_by_id:
+                check_fingerprint(stored_by_id[metrics[position].id], fingerprints[position])
+        by_id.update((record_id, PerformanceMetric(**parse_from_mongo(doc))) for record_id, doc in stored_by_id.items())
+        retried_ids = [record_id for record_id in retried_ids if record_id in stored_by_id]
+    
+    async with side_effect("performance_metrics", "anomaly_checked", inserted_ids, retried_ids) as checked:
+        async with side_effect("performance_metrics", "bucketed", inserted_ids, retried_ids) as bucketed:
+            await update_metric_buckets([by_id[record_id] for record_id in bucketed])
+        if checked:
+            await record_anomalies(get_anomaly_detector().observe_batch([by_id[record_id] for record_id in checked]))
+    
+    if idempotency_key:
+        idempotency_cache.put("performance_metrics_bulk", idempotency_key, (fingerprint, metrics))
+    return metrics
+
 @api_router.get("/metrics/node/{node_id}", response_model=List[PerformanceMetric])
 async def get_node_metrics(node_id: str, limit: int = 100):
-    metrics = await db.performance_metrics.find({"node_id": node_id}).sort("timestamp", -1).limit(limit).to_list(None)
+    async with db_limiter.slot("performance_metrics"):
+        metrics = await db.performance_metrics.find({"node_id": node_id}).sort("timestamp", -1).limit(limit).max_time_ms(DB_MAX_TIME_MS).to_list(None)
     return [PerformanceMetric(**parse_from_mongo(metric)) for metric in metrics]
 
 # Security Events Routes
 @api_router.post("/security-events", response_model=SecurityEvent)
-async def create_security_event(event: SecurityEvent):
-    event_data = prepare_for_mongo(event.dict())
-    await db.security_events.insert_one(event_data)
+async def create_security_event(event: SecurityEvent, idempotency_key: Optional[str] = Header(None)):
+    fingerprint = request_fingerprint(event.dict(exclude_unset=True)) if idempotency_key else None
+    if idempotency_key:
+        cached = cached_response("security_events", idempotency_key, fingerprint)
+        if cached is not None:
+            return cached
+        event = event.copy(update={"id": idempotent_id("security_events", idempotency_key)})
     
-    # Broadcast security alert
-    await manager.broadcast(json.dumps({"type": "security_event", "data": prepare_for_mongo(event.dict()), "timestamp": datetime.now(timezone.utc).isoformat()}))
+    event_data = {**prepare_for_mongo(event.dict()), "request_hash": fingerprint}
+    existing = await insert_once("security_events", event_data)
+    if existing:
+        event = SecurityEvent(**parse_from_mongo(existing))
+    else:
+        # Broadcast security alert
+        await manager.broadcast(json.dumps({"type": "security_event", "data": prepare_for_mongo(event.dict()), "timestamp": datetime.now(timezone.utc).isoformat()}))
     
+    if idempotency_key:
+        idempotency_cache.put("security_events", idempotency_key, (fingerprint, event))
     return event
 
 @api_router.get("/security-events", response_model=List[SecurityEvent])
 async def get_security_events(limit: int = 100):
-    events = await db.security_events.find().sort("timestamp", -1).limit(limit).to_list(None)
+    async with db_limiter.slot("security_events"):
+        events = await db.security_events.find().sort("timestamp", -1).limit(limit).max_time_ms(DB_MAX_TIME_MS).to_list(None)
     return [SecurityEvent(**parse_from_mongo(event)) for event in events]
 
+# Anomaly Routes
+@api_router.get("/anomalies", response_model=List[AnomalyEvent])
+async def get_anomalies(node_id: Optional[str] = None, limit: int = 100):
+    query = {"node_id": node_id} if node_id else {}
+    async with db_limiter.slot("anomaly_events"):
+        events = await db.anomaly_events.find(query).sort("timestamp", -1).limit(limit).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+    return [AnomalyEvent(**parse_from_mongo(event)) for event in events]
+
 # Analytics Routes
 @api_router.get("/analytics", response_model=SystemAnalytics)
 async def get_system_analytics():
     # Get node statistics
-    total_nodes = await db.edge_nodes.count_documents({})
-    active_nodes = await db.edge_nodes.count_documents({"status": "online"})
+    async with db_limiter.slot("edge_nodes"):
+        total_nodes = await db.edge_nodes.count_documents({}, maxTimeMS=DB_MAX_TIME_MS)
+        active_nodes = await db.edge_nodes.count_documents({"status": "online"}, maxTimeMS=DB_MAX_TIME_MS)
     
     # Get workload statistics
-    total_workloads = await db.workloads.count_documents({})
-    running_workloads = await db.workloads.count_documents({"status": "running"})
+    async with db_limiter.slot("workloads"):
+        total_workloads = await db.workloads.count_documents({}, maxTimeMS=DB_MAX_TIME_MS)
+        running_workloads = await db.workloads.count_documents({"status": "running"}, maxTimeMS=DB_MAX_TIME_MS)
     
     # Calculate averages
     pipeline = [
@@ -336,19 +1124,22 @@ async def get_system_analytics():
         }}
     ]
     
-    result = await db.edge_nodes.aggregate(pipeline).to_list(1)
+    async with db_limiter.slot("edge_nodes"):
+        result = await db.edge_nodes.aggregate(pipeline, maxTimeMS=DB_MAX_TIME_MS).to_list(1)
     avg_cpu = result[0]["avg_cpu"] if result and result[0]["avg_cpu"] else 0
     avg_memory = result[0]["avg_memory"] if result and result[0]["avg_memory"] else 0
     avg_latency = result[0]["avg_latency"] if result and result[0]["avg_latency"] else 0
     
     # Calculate success rate
-    completed_workloads = await db.workloads.count_documents({"status": "completed"})
-    failed_workloads = await db.workloads.count_documents({"status": "failed"})
+    async with db_limiter.slot("workloads"):
+        completed_workloads = await db.workloads.count_documents({"status": "completed"}, maxTimeMS=DB_MAX_TIME_MS)
+        failed_workloads = await db.workloads.count_documents({"status": "failed"}, maxTimeMS=DB_MAX_TIME_MS)
     total_finished = completed_workloads + failed_workloads
     success_rate = (completed_workloads / total_finished * 100) if total_finished > 0 else 100
     
     # Security incidents
-    security_incidents = await db.security_events.count_documents({"resolved": False})
+    async with db_limiter.slot("security_events"):
+        security_incidents = await db.security_events.count_documents({"resolved": False}, maxTimeMS=DB_MAX_TIME_MS)
     
     return SystemAnalytics(
         total_nodes=total_nodes,
@@ -362,6 +1153,64 @@ async def get_system_analytics():
         security_incidents=security_incidents
     )
 
+@api_router.get("/analytics/grouped", response_model=List[GroupedMetrics])
+async def get_grouped_analytics(
+    group_by: str = "location,node_type",
+    window_minutes: int = Query(60, gt=0, le=METRIC_BUCKETS_RETENTION_DAYS * 24 * 60)
+):
+    """Averages and percentiles per location / node_type, served from pre-aggregated buckets"""
+    fields = [field.strip() for field in group_by.split(",") if field.strip()]
+    if not fields or any(field not in GROUP_FIELDS for field in fields):
+        raise HTTPException(status_code=400, detail=f"group_by must be a comma-separated subset of {', '.join(GROUP_FIELDS)}")
+
+    window_end = datetime.now(timezone.utc)
+    window_start = bucket_start(window_end - timedelta(minutes=window_minutes))
+    async with db_limiter.slot("metric_buckets"):
+        buckets = await db.metric_buckets.find({"window_start": {"$gte": window_start.isoformat()}}, {"_id": 0}).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+
+    groups = merge_buckets(buckets, fields)
+    results = []
+    for key, group in sorted(groups.items()):
+        labels = dict(zip(fields, key))
+        results.append(GroupedMetrics(
+            location=labels.get("location"),
+            node_type=labels.get("node_type"),
+            window_start=window_start,
+            window_end=window_end,
+            sample_count=group["count"],
+            **{
+                name: summarize_metric(name, group[name]["sum"], group["count"], group[name]["hist"], group[name]["max"], group[name]["min"])
+                for name in ANOMALY_METRICS
+            }
+        ))
+    return results
+
+@api_router.get("/analytics/workload-timing", response_model=List[WorkloadTimingStats])
+async def get_workload_timing(group_by: str = "workload_type", phase: Optional[str] = None):
+    """Queue-wait and execution percentiles per workload_type, node_id or priority"""
+    if group_by not in LIFECYCLE_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(LIFECYCLE_DIMENSIONS)}")
+    if phase is not None and phase not in LIFECYCLE_PHASES:
+        raise HTTPException(status_code=400, detail=f"phase must be one of {', '.join(LIFECYCLE_PHASES)}")
+    
+    query = {"dimension": group_by}
+    if phase:
+        query["phase"] = phase
+    async with db_limiter.slot("workload_timing"):
+        timings = await db.workload_timing.find(query, {"_id": 0}).sort([("value", 1), ("phase", 1)]).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+    
+    return [
+        WorkloadTimingStats(
+            dimension=timing["dimension"],
+            value=timing["value"],
+            phase=timing["phase"],
+            count=timing.get("count", 0),
+            max_seconds=timing.get("max", 0.0),
+            seconds=summarize_metric(timing["phase"], timing.get("sum", 0.0), timing.get("count", 0), timing.get("hist", {}), timing.get("max"))
+        )
+        for timing in timings
+    ]
+
 # Smart City Demo Routes
 @api_router.post("/demo/setup-smart-city")
 async def setup_smart_city_demo():
@@ -409,12 +1258,35 @@ async def setup_smart_city_demo():
     for node_data in demo_nodes:
         node = EdgeNode(**node_data)
         node_dict = prepare_for_mongo(node.dict())
-        await db.edge_nodes.insert_one(node_dict)
+        async with db_limiter.slot("edge_nodes"):
+            await db.edge_nodes.insert_one(node_dict)
+        remember_node_group(node_dict)
         created_nodes.append(node)
     
     return {"message": f"Created {len(created_nodes)} demo edge nodes", "nodes": created_nodes}
 
 # WebSocket endpoint for real-time updates
+async def push_demo_metrics(websocket: WebSocket):
+    """Send random metric updates for every online node; skipped while edge_nodes is shedding load"""
+    try:
+        async with db_limiter.slot("edge_nodes"):
+            nodes = await db.edge_nodes.find({"status": "online"}, {"_id": 0, "id": 1}).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+    except HTTPException as error:
+        if error.status_code != 503:
+            raise
+        # A 503 means nothing on an open socket; try again on the next tick
+        return
+    for node in nodes:
+        updated_metrics = {
+            "type": "metrics_update",
+            "node_id": node["id"],
+            "cpu_usage": random.uniform(10, 80),
+            "memory_usage": random.uniform(20, 90),
+            "network_latency": random.uniform(5, 50),
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+        await manager.send_personal_message(json.dumps(updated_metrics), websocket)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
@@ -424,20 +1296,320 @@ async def websocket_endpoint(websocket: WebSocket):
             await asyncio.sleep(5)
             if websocket.client_state == WebSocketState.CONNECTED:
                 # Send random metric updates for demo
-                nodes = await db.edge_nodes.find({"status": "online"}).to_list(None)
-                for node in nodes:
-                    updated_metrics = {
-                        "type": "metrics_update",
-                        "node_id": node["id"],
-                        "cpu_usage": random.uniform(10, 80),
-                        "memory_usage": random.uniform(20, 90),
-                        "network_latency": random.uniform(5, 50),
-                        "timestamp": datetime.now(timezone.utc).isoformat()
-                    }
-                    await manager.send_personal_message(json.dumps(updated_metrics), websocket)
+                await push_demo_metrics(websocket)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+# Retention and compaction
+# History older than each policy's horizon is archived to gzipped NDJSON under ARCHIVE_DIR and
+# then deleted in bounded batches. The job yields whenever request handlers are queueing for
+# the database. Derived collections without archive value expire through TTL indexes instead.
+RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', ROOT_DIR / 'archive'))
+
+RETENTION_POLICIES = [
+    {
+        "collection": "performance_metrics",
+        "time_field": "timestamp",
+        "days": int(os.environ.get('METRICS_RETENTION_DAYS', '7')),
+        "filter": {}
+    },
+    {
+        "collection": "security_events",
+        "time_field": "timestamp",
+        "days": int(os.environ.get('SECURITY_EVENTS_RETENTION_DAYS', '30')),
+        "filter": {"resolved": True}
+    },
+    {
+        "collection": "workloads",
+        "time_field": "completed_at",
+        "days": int(os.environ.get('WORKLOADS_RETENTION_DAYS', '30')),
+        "filter": {"status": {"$in": ["completed", "failed"]}}
+    }
+]
+
+TTL_RETENTION_DAYS = {
+    "anomaly_events": int(os.environ.get('ANOMALY_EVENTS_RETENTION_DAYS', '7')),
+    "metric_buckets": METRIC_BUCKETS_RETENTION_DAYS
+}
+
+def append_archive(path: Path, lines: List[str]) -> int:
+    """Append lines to a gzip archive and return the number of compressed bytes written"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    size_before = path.stat().st_size if path.exists() else 0
+    # Each append becomes a new gzip member; readers such as zcat handle them transparently
+    with gzip.open(path, "ab") as archive:
+        archive.write("".join(lines).encode())
+    return path.stat().st_size - size_before
+
+class RetentionEngine:
+    def __init__(self, batch_size: int, batch_pause: float, interval: float, yield_queue: int):
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self.yield_queue = yield_queue
+        self.state = "idle"  # idle, running, throttled
+        self.throttle_events = 0
+        self.last_run_started: Optional[datetime] = None
+        self.last_run_finished: Optional[datetime] = None
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.totals = {
+            policy["collection"]: {"archived": 0, "deleted": 0, "archive_bytes": 0, "reclaimed_bytes": 0}
+            for policy in RETENTION_POLICIES
+        }
+
+    async def back_off(self):
+        if self.state != "throttled":
+            self.throttle_events += 1
+            self.state = "throttled"
+        await asyncio.sleep(max(self.batch_pause, 0.5))
+
+    async def wait_for_headroom(self):
+        while db_limiter.waiting > self.yield_queue:
+            await self.back_off()
+        self.state = "running"
+
+    async def limited(self, collection: str, operation):
+        """Run one retention query through db_limiter, backing off while it sheds load"""
+        while True:
+            await self.wait_for_headroom()
+            try:
+                async with db_limiter.slot(collection):
+                    return await operation()
+            except HTTPException as error:
+                if error.status_code != 503:
+                    raise
+                await self.back_off()
+
+    async def prune(self, policy: Dict[str, Any]):
+        collection = policy["collection"]
+        time_field = policy["time_field"]
+        now = datetime.now(timezone.utc)
+        # Timestamps are stored as UTC ISO strings, which order the same as the datetimes
+        cutoff = (now - timedelta(days=policy["days"])).isoformat()
+        query = {**policy["filter"], time_field: {"$lt": cutoff}}
+        archive_path = ARCHIVE_DIR / collection / f"{now.date().isoformat()}.ndjson.gz"
+        totals = self.totals[collection]
+
+        while True:
+            batch = await self.limited(
+                collection,
+                lambda: db[collection].find(query).sort(time_field, 1).limit(self.batch_size).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+            )
+            if not batch:
+                return
+
+            lines = [json.dumps({key: value for key, value in doc.items() if key != "_id"}, default=str) + "\n" for doc in batch]
+            totals["archive_bytes"] += await asyncio.to_thread(append_archive, archive_path, lines)
+            totals["archived"] += len(batch)
+
+            # Only documents that made it into the archive are deleted
+            result = await self.limited(collection, lambda: db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}}))
+            totals["deleted"] += result.deleted_count
+            # Serialized size of the removed documents, an approximation of the storage freed
+            totals["reclaimed_bytes"] += sum(len(line) for line in lines)
+
+            if len(batch) < self.batch_size:
+                return
+            await asyncio.sleep(self.batch_pause)
+
+    async def run_once(self):
+        async with self.lock:
+            self.last_run_started = datetime.now(timezone.utc)
+            try:
+                for policy in RETENTION_POLICIES:
+                    await self.prune(policy)
+            finally:
+                self.state = "idle"
+                self.last_run_finished = datetime.now(timezone.utc)
+
+    async def run_logged(self):
+        try:
+            await self.run_once()
+        except Exception:
+            logger.exception("Retention run failed")
+
+    def start(self) -> bool:
+        """Start a run in the background; False if one is already in progress"""
+        if self.lock.locked() or (self.task and not self.task.done()):
+            return False
+        self.state = "running"
+        self.task = asyncio.create_task(self.run_logged())
+        return True
+
+    async def run_forever(self):
+        while not startup_report["ready"]:
+            await asyncio.sleep(1)
+        while True:
+            await self.run_logged()
+            await asyncio.sleep(self.interval)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "throttle_events": self.throttle_events,
+            "last_run_started": self.last_run_started.isoformat() if self.last_run_started else None,
+            "last_run_finished": self.last_run_finished.isoformat() if self.last_run_finished else None,
+            "policies": [
+                {"collection": policy["collection"], "days": policy["days"], "mode": "archive", **self.totals[policy["collection"]]}
+                for policy in RETENTION_POLICIES
+            ] + [
+                {"collection": collection, "days": days, "mode": "ttl"}
+                for collection, days in TTL_RETENTION_DAYS.items()
+            ]
+        }
+
+retention_engine = RetentionEngine(
+    batch_size=int(os.environ.get('RETENTION_BATCH_SIZE', '1000')),
+    batch_pause=float(os.environ.get('RETENTION_BATCH_PAUSE_MS', '200')) / 1000,
+    interval=float(os.environ.get('RETENTION_INTERVAL_SECONDS', '3600')),
+    yield_queue=int(os.environ.get('RETENTION_YIELD_QUEUE', '0'))
+)
+
+@api_router.get("/retention")
+async def get_retention_status():
+    return retention_engine.status()
+
+@api_router.post("/retention/run", status_code=202)
+async def run_retention():
+    """Start a retention run in the background; poll GET /retention for progress"""
+    if not retention_engine.start():
+        raise HTTPException(status_code=409, detail="Retention run already in progress")
+    return retention_engine.status()
+
+# Startup and readiness
+STARTUP_PROFILE = os.environ.get('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+startup_report: Dict[str, Any] = {"ready": False, "import_seconds": None, "warmup_seconds": None, "phases": {}}
+
+async def create_indexes():
+    await db.workload_timing.create_index([("dimension", 1), ("value", 1), ("phase", 1)], unique=True)
+    for collection in IDEMPOTENT_COLLECTIONS:
+        await db[collection].create_index("id", unique=True)
+    await db.metric_buckets.create_index([("window_start", 1), ("location", 1), ("node_type", 1)], unique=True)
+    for policy in RETENTION_POLICIES:
+        await db[policy["collection"]].create_index(policy["time_field"])
+    for collection in TTL_RETENTION_DAYS:
+        await db[collection].create_index("expire_at", expireAfterSeconds=0)
+
+async def warm_node_groups():
+    nodes = await db.edge_nodes.find({}, {"_id": 0, "id": 1, "location": 1, "node_type": 1}).max_time_ms(DB_MAX_TIME_MS).to_list(None)
+    for node in nodes:
+        remember_node_group(node)
+
+async def warm_anomaly_detector():
+    await asyncio.to_thread(load_numpy)
+    get_anomaly_detector()
+
+async def timed_phase(phase: str, coroutine):
+    started = time.perf_counter()
+    await coroutine
+    elapsed = time.perf_counter() - started
+    startup_report["phases"][phase] = round(elapsed, 4)
+    if STARTUP_PROFILE:
+        logger.info("Startup phase %s took %.1f ms", phase, elapsed * 1000)
+
+async def warm_up():
+    """Build indexes and caches concurrently, retrying until the database is reachable"""
+    started = time.perf_counter()
+    delay = 1
+    while True:
+        try:
+            await asyncio.gather(
+                timed_phase("indexes", create_indexes()),
+                timed_phase("node_groups", warm_node_groups()),
+                timed_phase("anomaly_detector", warm_anomaly_detector())
+            )
+            break
+        except Exception:
+            logger.exception("Warm-up failed, retrying in %s s", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+    startup_report["warmup_seconds"] = round(time.perf_counter() - started, 4)
+    startup_report["ready"] = True
+    if STARTUP_PROFILE:
+        logger.info("Warm-up finished in %.1f ms", startup_report["warmup_seconds"] * 1000)
+
+@api_router.get("/ready")
+async def readiness():
+    """Readiness probe: 503 until indexes and caches are warm"""
+    return JSONResponse(status_code=200 if startup_report["ready"] else 503, content=startup_report)
+
+# Server-Sent Events and long-poll fallback for clients that cannot hold a WebSocket
+def format_sse(event_id: str, message: str) -> str:
+    return f"id: {event_id}\ndata: {message}\n\n"
+
+@api_router.get("/events")
+async def stream_events(request: Request, last_event_id: Optional[str] = Header(None)):
+    """SSE stream of broadcast events; a Last-Event-ID header resumes from the event buffer"""
+    # Subscribe before replaying so nothing broadcast in between is lost. The cursor is taken
+    # in the same step: anything newer is already in the queue, even before the stream starts.
+    queue = manager.subscribe()
+    subscribed_at = manager.last_event_id
+
+    async def event_stream():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            cursor = subscribed_at
+            if last_event_id:
+                backlog = manager.events_after(last_event_id)
+                if backlog is None:
+                    # Unknown id or too far behind: tell the client to refetch state, then continue live
+                    yield f"id: {manager.format_id(cursor)}\nevent: reset\ndata: {{}}\n\n"
+                else:
+                    cursor = manager.sequence_of(last_event_id)
+                    for event_id, message in backlog:
+                        cursor = event_id
+                        yield format_sse(manager.format_id(event_id), message)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                event_id, message = event
+                if event_id <= cursor:
+                    continue
+                cursor = event_id
+                yield format_sse(manager.format_id(event_id), message)
+        finally:
+            manager.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/events/poll")
+async def poll_events(after: Optional[str] = None, timeout: float = 25.0):
+    """Long-poll: returns buffered events after `after`, waiting up to `timeout` seconds for one"""
+    if after is None:
+        return {"last_event_id": manager.format_id(manager.last_event_id), "reset": False, "events": []}
+    
+    backlog = manager.events_after(after)
+    if backlog == []:
+        queue = manager.subscribe()
+        try:
+            await asyncio.wait_for(queue.get(), timeout=min(max(timeout, 0.0), LONG_POLL_MAX_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            manager.unsubscribe(queue)
+        backlog = manager.events_after(after)
+    
+    if backlog is None:
+        return {"last_event_id": manager.format_id(manager.last_event_id), "reset": True, "events": []}
+    return {
+        "last_event_id": manager.format_id(backlog[-1][0]) if backlog else after,
+        "reset": False,
+        "events": [{"id": manager.format_id(event_id), "data": json.loads(message)} for event_id, message in backlog]
+    }
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -455,7 +1627,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""Serve the API with startup profiling enabled.
+
+    python startup_profile.py --port 8001
+
+Times the import of server and publishes it as import_seconds on GET /api/ready next to the
+warm-up phases. For a per-module import breakdown use ``python -X importtime -c "import server"``.
+"""
+import argparse
+import importlib
+import os
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    os.environ["STARTUP_PROFILE"] = "1"
+    started = time.perf_counter()
+    server = importlib.import_module("server")
+    server.startup_report["import_seconds"] = round(time.perf_counter() - started, 4)
+    server.logger.info("Imported server in %.1f ms", server.startup_report["import_seconds"] * 1000)
+
+    import uvicorn
+    uvicorn.run(server.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Cold-start import benchmark for backend/server.py.
+
+    python benchmarks/startup.py --runs 20 --baseline <git-ref>
+
+Each run is a fresh interpreter started with ``-X importtime``; the cumulative import time of
+the server module is read from its report. With --baseline, server.py from that ref is measured
+too, interleaved with the working tree so both see the same machine load.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_DIR / "backend"
+# Older revisions build the Motor client at import time; it connects lazily, so any URL will do
+ENV = {"MONGO_URL": "mongodb://localhost:27017", "DB_NAME": "startup_benchmark", **os.environ}
+
+
+def import_ms(backend_dir):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=backend_dir, env=ENV, capture_output=True, text=True, check=True
+    )
+    # Report lines look like: "import time:   self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == "server":
+            return int(fields[1]) / 1000
+    raise RuntimeError("server missing from -X importtime report")
+
+
+def checkout(ref, directory):
+    source = subprocess.run(
+        ["git", "show", f"{ref}:backend/server.py"],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    (Path(directory) / "server.py").write_text(source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--baseline", help="git ref whose backend/server.py to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        targets = {"working tree": BACKEND_DIR}
+        if args.baseline:
+            checkout(args.baseline, baseline_dir)
+            targets = {args.baseline: Path(baseline_dir), **targets}
+
+        samples = {name: [] for name in targets}
+        for _ in range(args.runs):
+            for name, backend_dir in targets.items():
+                samples[name].append(import_ms(backend_dir))
+
+    for name, timings in samples.items():
+        print(f"{name:>14}: median {statistics.median(timings):7.1f} ms  "
+              f"min {min(timings):7.1f} ms  max {max(timings):7.1f} ms  ({args.runs} runs)")
+
+
+if __name__ == "__main__":
+    main()
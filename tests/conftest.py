@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+# backend/server.py is run as a top-level module (`uvicorn server:app`), so make it importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    """Point the server module at an in-memory Motor-compatible database with fresh caches"""
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(server, "client", client)
+    monkeypatch.setattr(server, "db", client["edge_test"])
+    server.node_groups.clear()
+    server.queue_waits.clear()
+    server.idempotency_cache.entries.clear()
+    # Semaphores bind to the event loop they first block on; each test runs its own loop
+    server.db_limiter.semaphores.clear()
+    server.db_limiter.waiting = 0
+    return server.db
+
+
+@pytest.fixture
+def make_metric():
+    """Factory for PerformanceMetric samples; the timestamp defaults to now, like the model"""
+    def build(node_id="node-1", cpu=50.0, memory=40.0, latency=10.0, deployment_latency=0.0, timestamp=None):
+        fields = dict(node_id=node_id, cpu_usage=cpu, memory_usage=memory, network_latency=latency,
+                      deployment_latency=deployment_latency, success_rate=100.0)
+        if timestamp is not None:
+            fields["timestamp"] = timestamp
+        return server.PerformanceMetric(**fields)
+
+    return build
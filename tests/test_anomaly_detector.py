@@ -0,0 +1,76 @@
+import pytest
+
+from server import MetricAnomalyDetector
+
+
+def feed(make_metric, detector, node_id, values):
+    events = []
+    for cpu in values:
+        events.extend(detector.observe(make_metric(node_id, cpu=cpu)))
+    return events
+
+
+def test_first_sample_seeds_baseline(make_metric):
+    detector = MetricAnomalyDetector()
+    detector.observe(make_metric("n1", cpu=70.0, memory=30.0, latency=5.0))
+    slot = detector.slots["n1"]
+    assert list(detector.mean[slot]) == [70.0, 30.0, 5.0]
+    assert list(detector.var[slot]) == [0.0, 0.0, 0.0]
+    assert detector.count[slot] == 1
+
+
+def test_no_events_during_warmup(make_metric):
+    detector = MetricAnomalyDetector(warmup=10)
+    events = feed(make_metric, detector, "n1", [50.0] * 5 + [99.0])
+    assert events == []
+
+
+def test_spike_after_warmup_is_flagged(make_metric):
+    detector = MetricAnomalyDetector(warmup=10)
+    feed(make_metric, detector, "n1", [50.0, 52.0, 48.0, 51.0, 49.0] * 3)
+    events = detector.observe(make_metric("n1", cpu=99.0))
+    assert [event.metric for event in events] == ["cpu_usage"]
+    assert events[0].node_id == "n1"
+    assert events[0].z_score > 0
+
+
+def test_min_std_floor_ignores_jitter_on_flat_gauge(make_metric):
+    detector = MetricAnomalyDetector(warmup=10)
+    events = feed(make_metric, detector, "n1", [50.0] * 12 + [51.0, 50.0, 50.0, 51.0])
+    assert events == []
+
+
+@pytest.mark.parametrize("cpu, severity", [(53.5, "medium"), (54.7, "high"), (56.5, "critical")])
+def test_severity_thresholds(cpu, severity, make_metric):
+    # A flat baseline of 50 with the 1.0 absolute std floor makes z == cpu - 50
+    detector = MetricAnomalyDetector(warmup=10, min_std=1.0, min_std_ratio=0.0)
+    feed(make_metric, detector, "n1", [50.0] * 10)
+    events = detector.observe(make_metric("n1", cpu=cpu))
+    assert [event.severity for event in events] == [severity]
+
+
+def test_latest_sample_per_node_wins_within_a_tick(make_metric):
+    detector = MetricAnomalyDetector()
+    detector.observe_batch([make_metric("n1", cpu=10.0), make_metric("n1", cpu=20.0)])
+    assert detector.mean[detector.slots["n1"]][0] == 20.0
+    assert detector.count[detector.slots["n1"]] == 1
+
+
+def test_forgotten_slot_is_reused_and_reset(make_metric):
+    detector = MetricAnomalyDetector()
+    feed(make_metric, detector, "n1", [80.0] * 3)
+    slot = detector.slots["n1"]
+    detector.forget("n1")
+    detector.observe(make_metric("n2", cpu=10.0))
+    assert detector.slots["n2"] == slot
+    assert detector.count[slot] == 1
+    assert detector.mean[slot][0] == 10.0
+
+
+def test_grows_past_initial_capacity(make_metric):
+    detector = MetricAnomalyDetector(capacity=1024)
+    detector.observe_batch([make_metric(f"n{i}", cpu=float(i % 100)) for i in range(1500)])
+    assert len(detector.count) >= 1500
+    assert len(set(detector.slots.values())) == 1500
+    assert detector.mean[detector.slots["n1499"]][0] == 99.0
+    assert detector.count[detector.slots["n0"]] == 1
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.websockets import WebSocketState
+
+import server
+from server import DBLimiter
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_sheds_with_retry_after_when_queue_is_full():
+    limiter = DBLimiter(concurrency=1, max_queue=1, queue_timeout=1.0, retry_after=7)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def holder():
+            async with limiter.slot("edge_nodes"):
+                await release.wait()
+
+        async def waiter():
+            async with limiter.slot("edge_nodes"):
+                pass
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+
+        with pytest.raises(HTTPException) as shed:
+            async with limiter.slot("edge_nodes"):
+                pass
+
+        release.set()
+        await asyncio.gather(holding, queued)
+        return shed.value
+
+    error = run(scenario())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "7"}
+    assert limiter.shed == 1
+    assert limiter.waiting == 0
+
+
+def test_queue_timeout_returns_503():
+    limiter = DBLimiter(concurrency=1, max_queue=10, queue_timeout=0.01, retry_after=1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def holder():
+            async with limiter.slot("workloads"):
+                await release.wait()
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as timed_out:
+            async with limiter.slot("workloads"):
+                pass
+        release.set()
+        await holding
+        return timed_out.value
+
+    error = run(scenario())
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+    assert limiter.waiting == 0
+
+
+def test_collections_have_independent_semaphores():
+    limiter = DBLimiter(concurrency=1, max_queue=10, queue_timeout=0.01, retry_after=1)
+
+    async def scenario():
+        async with limiter.slot("edge_nodes"):
+            async with limiter.slot("workloads"):
+                return True
+
+    assert run(scenario())
+
+
+def test_slot_is_released_when_body_raises():
+    limiter = DBLimiter(concurrency=1, max_queue=10, queue_timeout=0.05, retry_after=1)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            async with limiter.slot("edge_nodes"):
+                raise RuntimeError("insert failed")
+        # The only permit must be available again
+        async with limiter.slot("edge_nodes"):
+            return limiter.semaphores["edge_nodes"].locked()
+
+    assert run(scenario()) is True
+    assert limiter.shed == 0
+
+
+class FakeSocket:
+    client_state = WebSocketState.CONNECTED
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, message):
+        self.sent.append(message)
+
+
+def test_websocket_tick_reads_nodes_through_the_limiter(mock_db, monkeypatch):
+    socket = FakeSocket()
+    run(mock_db.edge_nodes.insert_many([{"id": "n1", "status": "online"}, {"id": "n2", "status": "offline"}]))
+    used = []
+    real_slot = server.db_limiter.slot
+    monkeypatch.setattr(server.db_limiter, "slot", lambda collection: used.append(collection) or real_slot(collection))
+
+    run(server.push_demo_metrics(socket))
+
+    assert used == ["edge_nodes"]
+    assert [json.loads(message)["node_id"] for message in socket.sent] == ["n1"]
+
+
+def test_websocket_tick_is_skipped_while_shedding(mock_db, monkeypatch):
+    socket = FakeSocket()
+    run(mock_db.edge_nodes.insert_one({"id": "n1", "status": "online"}))
+
+    def shed(collection):
+        raise server.db_limiter.overloaded(f"{collection} is busy, retry later")
+
+    monkeypatch.setattr(server.db_limiter, "slot", shed)
+
+    run(server.push_demo_metrics(socket))
+
+    assert socket.sent == []
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import server
+from server import ConnectionManager
+
+
+class FakeRequest:
+    async def is_disconnected(self):
+        return False
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = ConnectionManager(buffer_size=10)
+    manager.epoch = "1000.1"
+    monkeypatch.setattr(server, "manager", manager)
+    return manager
+
+
+async def read_chunks(response, count):
+    chunks = []
+    async for chunk in response.body_iterator:
+        chunks.append(chunk)
+        if len(chunks) == count:
+            break
+    await response.body_iterator.aclose()
+    return chunks
+
+
+@pytest.mark.parametrize("last_event_id,expected", [
+    (None, ["id: 1000.1-1\ndata: {\"n\": 1}\n\n"]),
+    # Ids from a previous process: reset to the subscribe-time cursor, then continue live
+    ("999.7-99", ["id: 1000.1-0\nevent: reset\ndata: {}\n\n", "id: 1000.1-1\ndata: {\"n\": 1}\n\n"]),
+])
+def test_event_broadcast_before_stream_starts_is_delivered(manager, last_event_id, expected):
+    async def scenario():
+        response = await server.stream_events(FakeRequest(), last_event_id=last_event_id)
+        # Broadcast after subscribing but before the response body is first iterated
+        await manager.broadcast('{"n": 1}')
+        return await asyncio.wait_for(read_chunks(response, 1 + len(expected)), timeout=1)
+
+    chunks = asyncio.run(scenario())
+    assert chunks[0].startswith("retry: ")
+    assert chunks[1:] == expected
+    assert not manager.subscribers
+
+
+def test_replayed_events_are_not_repeated_from_the_queue(manager):
+    async def scenario():
+        await manager.broadcast('{"n": 1}')
+        response = await server.stream_events(FakeRequest(), last_event_id="1000.1-0")
+        await manager.broadcast('{"n": 2}')
+        await manager.broadcast('{"n": 3}')
+        return await asyncio.wait_for(read_chunks(response, 4), timeout=1)
+
+    chunks = asyncio.run(scenario())
+    assert [chunk.split("\n")[0] for chunk in chunks[1:]] == ["id: 1000.1-1", "id: 1000.1-2", "id: 1000.1-3"]
+
+
+def test_id_from_another_process_is_reset_even_when_lower(manager):
+    async def scenario():
+        for n in range(3):
+            await manager.broadcast(f'{{"n": {n}}}')
+        response = await server.stream_events(FakeRequest(), last_event_id="999.7-1")
+        return await asyncio.wait_for(read_chunks(response, 2), timeout=1)
+
+    chunks = asyncio.run(scenario())
+    assert chunks[1] == "id: 1000.1-3\nevent: reset\ndata: {}\n\n"
+
+
+def test_poll_returns_buffered_events_without_waiting(manager):
+    async def scenario():
+        await manager.broadcast('{"n": 1}')
+        await manager.broadcast('{"n": 2}')
+        return await server.poll_events(after="1000.1-1", timeout=5)
+
+    assert asyncio.run(scenario()) == {"last_event_id": "1000.1-2", "reset": False, "events": [{"id": "1000.1-2", "data": {"n": 2}}]}
+
+
+def test_poll_wakes_up_on_broadcast(manager):
+    async def scenario():
+        poll = asyncio.create_task(server.poll_events(after="1000.1-0", timeout=5))
+        await asyncio.sleep(0.01)
+        await manager.broadcast('{"n": 1}')
+        return await asyncio.wait_for(poll, timeout=1)
+
+    assert asyncio.run(scenario())["events"] == [{"id": "1000.1-1", "data": {"n": 1}}]
+    assert not manager.subscribers
+
+
+def test_poll_times_out_with_no_events(manager):
+    result = asyncio.run(server.poll_events(after="1000.1-0", timeout=0.01))
+
+    assert result == {"last_event_id": "1000.1-0", "reset": False, "events": []}
+    assert not manager.subscribers
+
+
+@pytest.mark.parametrize("after", ["999.7-0", "1000.1-5", "garbage"])
+def test_poll_with_unknown_id_resets(manager, after):
+    result = asyncio.run(server.poll_events(after=after, timeout=0.01))
+
+    assert result == {"last_event_id": "1000.1-0", "reset": True, "events": []}
@@ -0,0 +1,213 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import EdgeNodeCreate, SecurityEvent, WorkloadCreate
+
+
+def workload(**overrides):
+    fields = dict(name="ingest", description="sensor ingest", node_id="node-1",
+                  workload_type="edge_computing", cpu_request=0.5, memory_request=256.0)
+    fields.update(overrides)
+    return WorkloadCreate(**fields)
+
+
+# Recent enough that the bucket TTL index does not expire what the tests write
+NOW = datetime.now(timezone.utc)
+
+
+async def workload_count(db):
+    node = await db.edge_nodes.find_one({"id": "node-1"})
+    return node["workload_count"]
+
+
+async def bucket_count(db):
+    buckets = await db.metric_buckets.find({}).to_list(None)
+    return sum(bucket["count"] for bucket in buckets)
+
+
+@pytest.fixture
+def node(mock_db):
+    async def seed():
+        await server.create_indexes()
+        await mock_db.edge_nodes.insert_one({"id": "node-1", "workload_count": 0})
+
+    asyncio.run(seed())
+    return mock_db
+
+
+def test_retry_does_not_count_workload_twice(node):
+    async def scenario():
+        first = await server.create_workload(workload(), idempotency_key="wl-1")
+        server.idempotency_cache.entries.clear()
+        second = await server.create_workload(workload(), idempotency_key="wl-1")
+        return first, second, await workload_count(node)
+
+    first, second, count = asyncio.run(scenario())
+    assert first.id == second.id
+    assert count == 1
+
+
+def test_retry_counts_workload_left_uncounted_by_failed_attempt(node, monkeypatch):
+    real_slot = server.db_limiter.slot
+    calls = {"edge_nodes": 0}
+
+    def flaky_slot(collection):
+        if collection == "edge_nodes":
+            calls["edge_nodes"] += 1
+            # The first attempt is shed right at the workload_count update, after the insert
+            if calls["edge_nodes"] == 2:
+                raise server.db_limiter.overloaded("edge_nodes is busy, retry later")
+        return real_slot(collection)
+
+    monkeypatch.setattr(server.db_limiter, "slot", flaky_slot)
+
+    async def scenario():
+        with pytest.raises(HTTPException) as shed:
+            await server.create_workload(workload(), idempotency_key="wl-1")
+        assert shed.value.status_code == 503
+        assert await node.workloads.count_documents({}) == 1
+        assert await workload_count(node) == 0
+
+        await server.create_workload(workload(), idempotency_key="wl-1")
+        await server.create_workload(workload(), idempotency_key="wl-1")
+        return await workload_count(node)
+
+    assert asyncio.run(scenario()) == 1
+
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_key_reused_with_different_body_is_rejected(node, cached):
+    async def scenario():
+        await server.create_workload(workload(), idempotency_key="wl-1")
+        if not cached:
+            server.idempotency_cache.entries.clear()
+        await server.create_workload(workload(cpu_request=2.0), idempotency_key="wl-1")
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(scenario())
+    assert rejected.value.status_code == 422
+
+
+def test_retry_rebuckets_metric_left_unbucketed_by_failed_attempt(node, monkeypatch, make_metric):
+    real_update = server.update_metric_buckets
+    attempts = []
+
+    async def flaky_update(metrics):
+        attempts.append(len(metrics))
+        if len(attempts) == 1:
+            raise server.db_limiter.overloaded("metric_buckets is busy, retry later")
+        await real_update(metrics)
+
+    monkeypatch.setattr(server, "update_metric_buckets", flaky_update)
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await server.create_performance_metric(make_metric(timestamp=NOW), idempotency_key="m-1")
+        stored = await node.performance_metrics.find_one({})
+        assert stored["bucketed"] is False
+        # Anomaly scoring never ran either, so its claim is still held by nobody
+        assert stored["anomaly_checked"] is False
+
+        await server.create_performance_metric(make_metric(timestamp=NOW), idempotency_key="m-1")
+        server.idempotency_cache.entries.clear()
+        await server.create_performance_metric(make_metric(timestamp=NOW), idempotency_key="m-1")
+        return await bucket_count(node)
+
+    assert asyncio.run(scenario()) == 1
+    assert attempts == [1, 1]
+
+
+def test_bulk_retry_only_processes_unfinished_samples(node, make_metric):
+    async def scenario():
+        await server.create_performance_metrics_bulk([make_metric(cpu=10.0, timestamp=NOW), make_metric(cpu=20.0, timestamp=NOW)], idempotency_key="b-1")
+        # Simulate an earlier attempt that stored the second sample but never bucketed it
+        stored = await node.performance_metrics.find().to_list(None)
+        pending = next(doc for doc in stored if doc["cpu_usage"] == 20.0)
+        await node.performance_metrics.update_one({"id": pending["id"]}, {"$set": {"bucketed": False}})
+
+        server.idempotency_cache.entries.clear()
+        retried = await server.create_performance_metrics_bulk([make_metric(cpu=10.0, timestamp=NOW), make_metric(cpu=20.0, timestamp=NOW)], idempotency_key="b-1")
+        return retried, await node.performance_metrics.count_documents({}), await bucket_count(node)
+
+    retried, stored, bucketed = asyncio.run(scenario())
+    assert len(retried) == 2
+    assert stored == 2
+    assert bucketed == 3
+
+
+def test_bulk_key_reused_with_different_samples_is_rejected(node, make_metric):
+    async def scenario():
+        await server.create_performance_metrics_bulk([make_metric(cpu=10.0, timestamp=NOW)], idempotency_key="b-1")
+        server.idempotency_cache.entries.clear()
+        await server.create_performance_metrics_bulk([make_metric(cpu=99.0, timestamp=NOW)], idempotency_key="b-1")
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(scenario())
+    assert rejected.value.status_code == 422
+
+
+class BroadcastLog:
+    def __init__(self):
+        self.types = []
+
+    async def broadcast(self, message):
+        self.types.append(json.loads(message)["type"])
+
+
+@pytest.fixture
+def broadcasts(monkeypatch):
+    log = BroadcastLog()
+    monkeypatch.setattr(server.manager, "broadcast", log.broadcast)
+    return log
+
+
+def edge_node(**overrides):
+    fields = dict(name="Traffic Camera", location="Main Street", node_type="traffic_camera")
+    fields.update(overrides)
+    return EdgeNodeCreate(**fields)
+
+
+def security_event(**overrides):
+    fields = dict(node_id="node-1", event_type="rbac_violation", severity="high", description="denied", timestamp=NOW)
+    fields.update(overrides)
+    return SecurityEvent(**fields)
+
+
+@pytest.mark.parametrize("create, build, collection", [
+    (server.create_edge_node, edge_node, "edge_nodes"),
+    (server.create_security_event, security_event, "security_events"),
+])
+def test_retry_reuses_record_without_second_broadcast(node, broadcasts, create, build, collection):
+    async def scenario():
+        first = await create(build(), idempotency_key="k-1")
+        server.idempotency_cache.entries.clear()
+        second = await create(build(), idempotency_key="k-1")
+        return first, second, await node[collection].count_documents({"id": first.id})
+
+    first, second, stored = asyncio.run(scenario())
+    assert first.id == second.id
+    assert stored == 1
+    assert len(broadcasts.types) == 1
+
+
+@pytest.mark.parametrize("cached", [True, False])
+@pytest.mark.parametrize("create, build, changed", [
+    (server.create_edge_node, edge_node, {"location": "Park"}),
+    (server.create_security_event, security_event, {"severity": "low"}),
+])
+def test_edge_node_and_event_key_reuse_with_different_body_is_rejected(node, broadcasts, create, build, changed, cached):
+    async def scenario():
+        await create(build(), idempotency_key="k-1")
+        if not cached:
+            server.idempotency_cache.entries.clear()
+        await create(build(**changed), idempotency_key="k-1")
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(scenario())
+    assert rejected.value.status_code == 422
+    assert len(broadcasts.types) == 1
@@ -0,0 +1,160 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from server import (
+    BUCKET_EDGES,
+    bucket_start,
+    histogram_bin,
+    histogram_percentile,
+    merge_buckets,
+    resolve_node_groups,
+    update_metric_buckets,
+)
+
+
+WINDOW = datetime(2026, 1, 1, 12, 3, tzinfo=timezone.utc)
+
+
+def test_histogram_bin_edges():
+    # cpu_usage edges are 0, 5, ..., 100; a value on an edge opens the next bin
+    assert histogram_bin("cpu_usage", 0.0) == 0
+    assert histogram_bin("cpu_usage", 4.99) == 0
+    assert histogram_bin("cpu_usage", 5.0) == 1
+    assert histogram_bin("cpu_usage", -3.0) == 0
+
+
+def test_histogram_bin_clamps_past_last_edge():
+    last_bin = len(BUCKET_EDGES["cpu_usage"]) - 2
+    assert histogram_bin("cpu_usage", 100.0) == last_bin
+    assert histogram_bin("cpu_usage", 250.0) == last_bin
+    assert histogram_bin("network_latency", 1e6) == len(BUCKET_EDGES["network_latency"]) - 2
+
+
+def test_histogram_percentile_interpolates_within_bin():
+    # 10 samples in [50, 55): the median sits halfway through the bin
+    assert histogram_percentile("cpu_usage", {"10": 10}, 0.5) == pytest.approx(52.5)
+    assert histogram_percentile("cpu_usage", {"0": 5, "19": 5}, 0.5) == pytest.approx(5.0)
+    assert histogram_percentile("cpu_usage", {"0": 5, "19": 5}, 0.99) == pytest.approx(99.9)
+
+
+def test_histogram_percentile_empty_and_overflow():
+    assert histogram_percentile("cpu_usage", {}, 0.95) == 0.0
+    # Stray bins past the edge table fall back to the last edge
+    assert histogram_percentile("cpu_usage", {"40": 3}, 0.5) == BUCKET_EDGES["cpu_usage"][-1]
+
+
+def test_bucket_start_aligns_to_window():
+    start = bucket_start(datetime(2026, 1, 1, 12, 7, 42, tzinfo=timezone.utc))
+    assert start == datetime(2026, 1, 1, 12, 5, tzinfo=timezone.utc)
+
+
+def test_merge_buckets_across_windows_and_groups():
+    def bucket(window, location, node_type, count, cpu_sum, hist):
+        return {
+            "window_start": window, "location": location, "node_type": node_type, "count": count,
+            "cpu_usage": {"sum": cpu_sum, "hist": hist},
+        }
+
+    buckets = [
+        bucket("2026-01-01T12:00:00+00:00", "Main", "camera", 2, 100.0, {"10": 2}),
+        bucket("2026-01-01T12:05:00+00:00", "Main", "camera", 3, 90.0, {"10": 1, "2": 2}),
+        bucket("2026-01-01T12:05:00+00:00", "Park", "sensor", 1, 20.0, {"4": 1}),
+    ]
+    by_location = merge_buckets(buckets, ["location"])
+    assert set(by_location) == {("Main",), ("Park",)}
+    main = by_location[("Main",)]
+    assert main["count"] == 5
+    assert main["cpu_usage"]["sum"] == 190.0
+    assert main["cpu_usage"]["hist"] == {"10": 3, "2": 2}
+    assert main["memory_usage"] == {"sum": 0.0, "min": None, "max": None, "hist": {}}
+
+    overall = merge_buckets(buckets, ["node_type"])
+    assert overall[("camera",)]["count"] == 5
+    assert overall[("sensor",)]["count"] == 1
+
+
+def test_update_metric_buckets_upserts_per_window_and_group(mock_db, make_metric):
+    async def scenario():
+        await mock_db.edge_nodes.insert_one({"id": "n1", "location": "Main", "node_type": "camera"})
+        await update_metric_buckets([make_metric("n1", 52.0, timestamp=WINDOW), make_metric("n1", 12.0, timestamp=WINDOW), make_metric("ghost", 70.0, timestamp=WINDOW)])
+        await update_metric_buckets([make_metric("n1", 53.0, timestamp=WINDOW)])
+        return await mock_db.metric_buckets.find({}, {"_id": 0}).to_list(None)
+
+    buckets = {(bucket["location"], bucket["node_type"]): bucket for bucket in asyncio.run(scenario())}
+    main = buckets[("Main", "camera")]
+    assert main["window_start"] == "2026-01-01T12:00:00+00:00"
+    assert main["count"] == 3
+    assert main["cpu_usage"]["sum"] == pytest.approx(117.0)
+    assert main["cpu_usage"]["hist"] == {"10": 2, "2": 1}
+    assert (main["cpu_usage"]["min"], main["cpu_usage"]["max"]) == (12.0, 53.0)
+    assert buckets[("unknown", "unknown")]["count"] == 1
+
+
+def test_resolve_node_groups_caches_unknown_nodes(mock_db):
+    async def scenario():
+        first = await resolve_node_groups(["ghost"])
+        # Within the TTL the cached miss is served without another edge_nodes lookup
+        await mock_db.edge_nodes.insert_one({"id": "ghost", "location": "Main", "node_type": "camera"})
+        second = await resolve_node_groups(["ghost"])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second == {"ghost": {"location": "unknown", "node_type": "unknown"}}
+    assert "ghost" in server.node_groups
+
+
+def test_resolve_node_groups_rereads_stale_entries(mock_db):
+    async def scenario():
+        await mock_db.edge_nodes.insert_one({"id": "n1", "location": "Main", "node_type": "camera"})
+        before = await resolve_node_groups(["n1"])
+        # Another worker moves the node; this worker's entry then expires
+        await mock_db.edge_nodes.update_one({"id": "n1"}, {"$set": {"location": "Park"}})
+        cached = await resolve_node_groups(["n1"])
+        server.node_groups["n1"] = (0.0, server.node_groups["n1"][1])
+        after = await resolve_node_groups(["n1"])
+        return before, cached, after
+
+    before, cached, after = asyncio.run(scenario())
+    assert before["n1"]["location"] == "Main"
+    assert cached["n1"]["location"] == "Main"
+    assert after["n1"]["location"] == "Park"
+
+
+def test_merge_buckets_keeps_extremes_across_windows():
+    buckets = [
+        {"location": "Main", "count": 1, "cpu_usage": {"sum": 30.0, "min": 30.0, "max": 30.0, "hist": {"6": 1}}},
+        {"location": "Main", "count": 2, "cpu_usage": {"sum": 90.0, "min": 20.0, "max": 70.0, "hist": {"4": 1, "14": 1}}},
+    ]
+    merged = merge_buckets(buckets, ["location"])[("Main",)]["cpu_usage"]
+    assert (merged["min"], merged["max"]) == (20.0, 70.0)
+
+
+def test_grouped_percentiles_of_constant_series_stay_on_the_value(mock_db, make_metric):
+    now = datetime.now(timezone.utc)
+    metrics = [
+        make_metric("n1", cpu=52.0, memory=40.0, latency=10.0, timestamp=now)
+        for _ in range(16)
+    ]
+
+    async def scenario():
+        await mock_db.edge_nodes.insert_one({"id": "n1", "location": "Main", "node_type": "camera"})
+        await update_metric_buckets(metrics)
+        return await server.get_grouped_analytics(group_by="location", window_minutes=60)
+
+    [group] = asyncio.run(scenario())
+    for name, value in [("cpu_usage", 52.0), ("memory_usage", 40.0), ("network_latency", 10.0)]:
+        summary = getattr(group, name)
+        assert summary.average == pytest.approx(value)
+        assert (summary.p50, summary.p95, summary.p99) == (value, value, value)
+
+
+@pytest.mark.parametrize("window_minutes", [0, 10**10])
+def test_grouped_window_outside_bucket_retention_is_rejected(mock_db, window_minutes):
+    # Without the context manager TestClient skips the lifespan, so no database is needed
+    response = TestClient(server.app).get("/api/analytics/grouped", params={"window_minutes": window_minutes})
+
+    assert response.status_code == 422
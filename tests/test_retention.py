@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+import json
+from collections import defaultdict
+
+import pytest
+
+import server
+from server import RetentionEngine
+
+
+class StubCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def max_time_ms(self, ms):
+        return self
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class StubResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+
+class StubCollection:
+    """Records the order of retention calls and what the archive held when each delete ran"""
+
+    def __init__(self, docs, archive_path, log):
+        self.docs = docs
+        self.archive_path = archive_path
+        self.log = log
+
+    def find(self, query):
+        self.log.append("find")
+        return StubCursor(self.docs)
+
+    async def delete_many(self, query):
+        ids = set(query["_id"]["$in"])
+        archived = []
+        if self.archive_path.exists():
+            with gzip.open(self.archive_path, "rt") as archive:
+                archived = [json.loads(line)["id"] for line in archive]
+        self.log.append(("delete", sorted(ids), archived))
+        self.docs = [doc for doc in self.docs if doc["_id"] not in ids]
+        return StubResult(len(ids))
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "ARCHIVE_DIR", tmp_path)
+    monkeypatch.setattr(server.db_limiter, "semaphores", {})
+    monkeypatch.setattr(server.db_limiter, "waiting", 0)
+    return RetentionEngine(batch_size=2, batch_pause=0, interval=3600, yield_queue=0)
+
+
+def stub_db(monkeypatch, tmp_path, docs):
+    log = []
+    archive_path = tmp_path / "performance_metrics" / f"{server.datetime.now(server.timezone.utc).date().isoformat()}.ndjson.gz"
+    collections = defaultdict(lambda: StubCollection([], tmp_path / "unused.gz", log))
+    collections["performance_metrics"] = StubCollection(docs, archive_path, log)
+    monkeypatch.setattr(server, "db", collections)
+    return log
+
+
+def old_metrics(count):
+    return [{"_id": position, "id": f"m-{position}", "timestamp": "2020-01-01T00:00:00+00:00"} for position in range(count)]
+
+
+def test_each_batch_is_archived_before_it_is_deleted(engine, monkeypatch, tmp_path):
+    log = stub_db(monkeypatch, tmp_path, old_metrics(3))
+
+    asyncio.run(engine.prune(server.RETENTION_POLICIES[0]))
+
+    deletes = [entry for entry in log if entry != "find"]
+    assert deletes == [
+        ("delete", [0, 1], ["m-0", "m-1"]),
+        ("delete", [2], ["m-0", "m-1", "m-2"]),
+    ]
+    totals = engine.totals["performance_metrics"]
+    assert totals["archived"] == 3
+    assert totals["deleted"] == 3
+    assert totals["archive_bytes"] > 0
+
+
+def test_run_yields_while_requests_are_queued(engine, monkeypatch, tmp_path):
+    log = stub_db(monkeypatch, tmp_path, old_metrics(1))
+    monkeypatch.setattr(server.db_limiter, "waiting", 3)
+
+    async def scenario():
+        run = asyncio.create_task(engine.run_once())
+        await asyncio.sleep(0.05)
+        throttled = (engine.state, engine.throttle_events, list(log))
+        server.db_limiter.waiting = 0
+        await run
+        return throttled
+
+    state, throttle_events, calls = asyncio.run(scenario())
+    assert (state, throttle_events, calls) == ("throttled", 1, [])
+    assert engine.state == "idle"
+    assert engine.totals["performance_metrics"]["deleted"] == 1
+
+
+def test_shed_query_is_retried_as_throttled(engine, monkeypatch, tmp_path):
+    log = stub_db(monkeypatch, tmp_path, old_metrics(1))
+    real_slot = server.db_limiter.slot
+    shed = []
+
+    def flaky_slot(collection):
+        if not shed:
+            shed.append(collection)
+            raise server.db_limiter.overloaded(f"{collection} is busy, retry later")
+        return real_slot(collection)
+
+    monkeypatch.setattr(server.db_limiter, "slot", flaky_slot)
+
+    asyncio.run(engine.prune(server.RETENTION_POLICIES[0]))
+
+    assert shed == ["performance_metrics"]
+    assert engine.throttle_events == 1
+    assert engine.totals["performance_metrics"]["deleted"] == 1
+    assert log[0] == "find"
+
+
+def test_manual_run_starts_in_background(engine, monkeypatch, tmp_path):
+    stub_db(monkeypatch, tmp_path, old_metrics(1))
+    monkeypatch.setattr(server, "retention_engine", engine)
+
+    async def scenario():
+        status = await server.run_retention()
+        with pytest.raises(server.HTTPException) as conflict:
+            await server.run_retention()
+        await engine.task
+        return status, conflict.value.status_code
+
+    status, conflict = asyncio.run(scenario())
+    assert status["state"] == "running"
+    assert conflict == 409
+    assert engine.totals["performance_metrics"]["deleted"] == 1
+
+
+def test_status_reports_mode_and_counts_per_policy(engine, monkeypatch, tmp_path):
+    stub_db(monkeypatch, tmp_path, old_metrics(3))
+    asyncio.run(engine.run_once())
+
+    policies = {policy["collection"]: policy for policy in engine.status()["policies"]}
+    assert policies["performance_metrics"] == {
+        "collection": "performance_metrics",
+        "days": server.RETENTION_POLICIES[0]["days"],
+        "mode": "archive",
+        "archived": 3,
+        "deleted": 3,
+        "archive_bytes": engine.totals["performance_metrics"]["archive_bytes"],
+        "reclaimed_bytes": engine.totals["performance_metrics"]["reclaimed_bytes"],
+    }
+    assert policies["security_events"]["mode"] == "archive"
+    assert policies["security_events"]["archived"] == 0
+    assert policies["anomaly_events"] == {"collection": "anomaly_events", "days": server.TTL_RETENTION_DAYS["anomaly_events"], "mode": "ttl"}
+    assert policies["metric_buckets"]["mode"] == "ttl"
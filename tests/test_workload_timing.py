@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import fill_deployment_latency, record_lifecycle_transition
+
+CREATED = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def stored_workload(status="pending", deployed_at=None, created=CREATED):
+    workload = {"id": "wl-1", "node_id": "node-1", "workload_type": "ml_inference", "priority": "high",
+                "status": status, "created_at": created.isoformat()}
+    if deployed_at:
+        workload["deployed_at"] = deployed_at.isoformat()
+    return workload
+
+
+def timings(db):
+    return asyncio.run(db.workload_timing.find({}, {"_id": 0}).sort([("dimension", 1), ("phase", 1)]).to_list(None))
+
+
+def test_running_records_queue_wait_per_dimension(mock_db):
+    asyncio.run(record_lifecycle_transition(stored_workload(), "running", CREATED + timedelta(seconds=4), None))
+
+    recorded = timings(mock_db)
+    assert [(t["dimension"], t["value"], t["phase"]) for t in recorded] == [
+        ("node_id", "node-1", "queue_wait"),
+        ("priority", "high", "queue_wait"),
+        ("workload_type", "ml_inference", "queue_wait"),
+    ]
+    assert all(t["count"] == 1 and t["sum"] == 4.0 and t["max"] == 4.0 and t["last"] == 4.0 for t in recorded)
+
+
+def test_execution_is_keyed_on_terminal_status(mock_db):
+    deployed = CREATED + timedelta(seconds=5)
+    asyncio.run(record_lifecycle_transition(stored_workload("running", deployed), "completed", deployed + timedelta(seconds=30), None))
+    asyncio.run(record_lifecycle_transition(stored_workload("running", deployed), "failed", deployed + timedelta(seconds=2), None))
+
+    by_phase = {t["phase"]: t for t in timings(mock_db) if t["dimension"] == "node_id"}
+    assert by_phase["execution_completed"]["sum"] == 30.0
+    assert by_phase["execution_failed"]["sum"] == 2.0
+
+
+def test_execution_falls_back_to_reported_time(mock_db):
+    asyncio.run(record_lifecycle_transition(stored_workload("pending"), "completed", CREATED, 7.5))
+
+    assert {t["phase"]: t["sum"] for t in timings(mock_db)} == {"execution_completed": 7.5}
+
+
+def test_unchanged_or_untimed_transition_records_nothing(mock_db):
+    asyncio.run(record_lifecycle_transition(stored_workload("running"), "running", CREATED, None))
+    asyncio.run(record_lifecycle_transition(stored_workload("running"), "failed", CREATED, None))
+
+    assert timings(mock_db) == []
+
+
+def test_rerun_after_failure_is_not_a_queue_wait(mock_db):
+    asyncio.run(record_lifecycle_transition(stored_workload("failed"), "running", CREATED + timedelta(hours=2), None))
+
+    assert timings(mock_db) == []
+
+
+def test_transition_is_recorded_while_limiter_sheds(mock_db, monkeypatch):
+    def shed(collection):
+        raise server.db_limiter.overloaded(f"{collection} is busy, retry later")
+
+    monkeypatch.setattr(server.db_limiter, "slot", shed)
+    asyncio.run(record_lifecycle_transition(stored_workload(), "running", CREATED + timedelta(seconds=4), None))
+
+    assert len(timings(mock_db)) == len(server.LIFECYCLE_DIMENSIONS)
+
+
+def test_deployment_latency_comes_from_latest_queue_wait(mock_db, make_metric):
+    created = datetime.now(timezone.utc) - timedelta(seconds=30)
+
+    async def scenario():
+        unknown = await fill_deployment_latency([make_metric(deployment_latency=None)])
+        await record_lifecycle_transition(stored_workload(created=created), "running", created + timedelta(seconds=9), None)
+        await record_lifecycle_transition(stored_workload(created=created), "running", created + timedelta(seconds=3), None)
+        return unknown, await fill_deployment_latency([make_metric(deployment_latency=None), make_metric(deployment_latency=1.25)])
+
+    unknown, filled = asyncio.run(scenario())
+    assert unknown[0].deployment_latency is None
+    assert [metric.deployment_latency for metric in filled] == [3.0, 1.25]
+
+
+def test_deployment_latency_lookup_is_cached_per_node(mock_db, make_metric):
+    recorded_at = datetime.now(timezone.utc).isoformat()
+
+    async def scenario():
+        await mock_db.workload_timing.insert_one(
+            {"dimension": "node_id", "value": "node-1", "phase": "queue_wait", "last": 2.0, "last_at": recorded_at})
+        first = await fill_deployment_latency([make_metric(deployment_latency=None)])
+        # Within the TTL another worker's newer wait is not read back yet
+        await mock_db.workload_timing.update_one({"value": "node-1"}, {"$set": {"last": 8.0}})
+        cached = await fill_deployment_latency([make_metric(deployment_latency=None)])
+        server.queue_waits["node-1"] = (0.0, server.queue_waits["node-1"][1])
+        refreshed = await fill_deployment_latency([make_metric(deployment_latency=None)])
+        return first, cached, refreshed
+
+    first, cached, refreshed = asyncio.run(scenario())
+    assert [first[0].deployment_latency, cached[0].deployment_latency, refreshed[0].deployment_latency] == [2.0, 2.0, 8.0]
+
+
+def test_stale_queue_wait_is_not_stamped_on_new_samples(mock_db, make_metric):
+    # CREATED is far older than QUEUE_WAIT_MAX_AGE_SECONDS
+    asyncio.run(record_lifecycle_transition(stored_workload(), "running", CREATED + timedelta(seconds=4), None))
+
+    assert "node-1" in server.queue_waits
+    assert asyncio.run(fill_deployment_latency([make_metric(deployment_latency=None)]))[0].deployment_latency is None
+
+
+def test_unknown_phase_is_rejected(mock_db):
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(server.get_workload_timing(phase="execution"))
+    assert rejected.value.status_code == 400